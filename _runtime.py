@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Event loop runner shared by the MCP server, client and CLI scripts
+"""
+
+import asyncio
+import sys
+from typing import Any, Coroutine
+
+def run_with_uvloop(main: Coroutine) -> Any:
+    """asyncio.run(main) on a uvloop event loop when available (non-Windows)
+
+    Python 3.11+ passes uvloop's loop factory to asyncio.Runner; older versions
+    fall back to uvloop.install(), whose event loop policy 3.12 deprecates.
+    """
+    uvloop = None
+    if sys.platform != "win32":
+        try:
+            import uvloop
+        except ImportError:
+            pass
+    if uvloop is None:
+        return asyncio.run(main)
+    if hasattr(asyncio, "Runner"):
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            return runner.run(main)
+    uvloop.install()
+    return asyncio.run(main)
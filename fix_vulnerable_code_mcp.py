@@ -4,17 +4,29 @@ Backward compatible wrapper using MCP architecture
 """
 
 import argparse
-import asyncio
 import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional
 
+try:
+    import orjson  # optional, faster JSON serialization
+except ImportError:
+    orjson = None
+
 sys.path.insert(0, str(Path(__file__).parent))
 
+from _runtime import run_with_uvloop
 from mcp_client import SecurityMCPClient, SecurityAnalysisWorkflow
 
+def dumps_json(obj) -> bytes:
+    """Serialize to indented, non-ASCII-escaped UTF-8 JSON bytes (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
 def convert_old_to_new_args(args) -> dict:
     """Convert old argument format to new MCP format"""
     if args.github:
@@ -65,35 +77,29 @@ async def run_mcp_analysis(args) -> dict:
     finally:
         await client.disconnect()
 
-def save_results_old_format(results: dict, output_dir: str, dry_run: bool = False):
-    """Save results in the old format for backward compatibility"""
-    if dry_run:
-        return
-    
-    output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
-    
-    # Convert MCP results to old format
+def build_old_format_results(results: dict, args) -> dict:
+    """Convert MCP results to the old JSON format for backward compatibility"""
     old_format_results = {
         "source": "mcp",
-        "model": "gpt-4o-mini",  # Default model
-        "output_dir": str(output_path),
+        "model": args.model,
+        "output_dir": args.out,
         "results": []
     }
     
     # Add source-specific metadata
-    if "repository" in results:
+    if args.github:
+        owner, repo, branch, folder = args.github
         old_format_results.update({
             "source": "github",
-            "owner": results["repository"].split("/")[0],
-            "repo": results["repository"].split("/")[1],
-            "branch": results.get("branch", "main"),
-            "folder": results.get("folder", "")
+            "owner": owner,
+            "repo": repo,
+            "branch": branch,
+            "folder": folder
         })
     else:
         old_format_results.update({
             "source": "local",
-            "local_folder": results.get("folder", "")
+            "local_folder": str(Path(args.local).resolve())
         })
     
     # Convert file results
@@ -110,21 +116,11 @@ def save_results_old_format(results: dict, output_dir: str, dry_run: bool = Fals
                     "prompt_preview": analysis.get("prompt_name", f"prompt_{i+1}")
                 })
             else:
-                # Save fixed code file
-                if analysis.get("fixed_code"):
-                    prompt_suffix = f"_prompt_{i+1}"
-                    base_name = Path(file_path)
-                    new_name = f"{base_name.stem}{prompt_suffix}{base_name.suffix}"
-                    new_path = base_name.parent / new_name
-                    out_path = output_path / new_path
-                    out_path.parent.mkdir(parents=True, exist_ok=True)
-                    out_path.write_text(analysis["fixed_code"], encoding="utf-8")
-                
                 prompt_results.append({
                     "prompt_index": i + 1,
                     "summary": analysis.get("description", ""),
                     "findings": analysis.get("findings", []),
-                    "written": bool(analysis.get("fixed_code")),
+                    "written": bool(analysis.get("fixed_code")) and not args.dry_run,
                     "prompt_preview": analysis.get("prompt_used", f"prompt_{i+1}")
                 })
         
@@ -133,10 +129,47 @@ def save_results_old_format(results: dict, output_dir: str, dry_run: bool = Fals
             "prompt_results": prompt_results
         })
     
+    return old_format_results
+
+def _write_text(path: str, text: str):
+    """Write text to path as UTF-8"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def save_results_old_format(results: dict, summary_json: bytes, output_dir: str, dry_run: bool = False):
+    """Write fixed code files and the pre-serialized JSON summary"""
+    if dry_run:
+        return
+    
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    # Save fixed code files (writes are overlapped on a thread pool)
+    made_dirs = set()
+    with ThreadPoolExecutor(max_workers=16) as io_pool:
+        writes = []
+        for file_result in results.get("results", []):
+            file_path = file_result["file_path"]
+            base_dir, base_file = os.path.split(file_path)
+            stem, suffix = os.path.splitext(base_file)
+            parent = os.path.join(output_dir, base_dir)
+            for i, analysis in enumerate(file_result.get("analyses", [])):
+                if "error" in analysis or not analysis.get("fixed_code"):
+                    continue
+                if parent not in made_dirs:
+                    os.makedirs(parent, exist_ok=True)
+                    made_dirs.add(parent)
+                new_name = f"{stem}_prompt_{i+1}{suffix}"
+                writes.append(io_pool.submit(_write_text, os.path.join(parent, new_name), analysis["fixed_code"]))
+        
+        # Wait for all writes and surface any write errors
+        for write in writes:
+            write.result()
+    
     # Save JSON summary
     json_path = output_path / "analysis_summary.json"
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(old_format_results, f, indent=2, ensure_ascii=False)
+    with open(json_path, 'wb') as f:
+        f.write(summary_json)
     
     print(f"Results saved to {output_path}", file=sys.stderr)
     print(f"JSON summary saved to {json_path}", file=sys.stderr)
@@ -162,63 +195,17 @@ def main(argv: Optional[List[str]] = None) -> int:
 
     # Run MCP analysis
     try:
-        results = asyncio.run(run_mcp_analysis(args))
-        
-        # Save results in old format for compatibility
-        save_results_old_format(results, args.out, args.dry_run)
-        
-        # Print JSON output (old format)
-        old_format = {
-            "source": "mcp",
-            "model": args.model,
-            "output_dir": args.out,
-            "results": []
-        }
-        
-        # Add source-specific metadata
-        if args.github:
-            owner, repo, branch, folder = args.github
-            old_format.update({
-                "source": "github",
-                "owner": owner,
-                "repo": repo,
-                "branch": branch,
-                "folder": folder
-            })
-        else:
-            old_format.update({
-                "source": "local",
-                "local_folder": str(Path(args.local).resolve())
-            })
+        results = run_with_uvloop(run_mcp_analysis(args))
         
-        # Convert results
-        for file_result in results.get("results", []):
-            file_path = file_result["file_path"]
-            analyses = file_result.get("analyses", [])
-            
-            prompt_results = []
-            for i, analysis in enumerate(analyses):
-                if "error" in analysis:
-                    prompt_results.append({
-                        "prompt_index": i + 1,
-                        "error": analysis["error"],
-                        "prompt_preview": analysis.get("prompt_name", f"prompt_{i+1}")
-                    })
-                else:
-                    prompt_results.append({
-                        "prompt_index": i + 1,
-                        "summary": analysis.get("description", ""),
-                        "findings": analysis.get("findings", []),
-                        "written": (not args.dry_run),
-                        "prompt_preview": analysis.get("prompt_used", f"prompt_{i+1}")
-                    })
-            
-            old_format["results"].append({
-                "path": file_path,
-                "prompt_results": prompt_results
-            })
+        # Build the old-format summary once and reuse it for disk and stdout
+        old_format = build_old_format_results(results, args)
+        summary_json = dumps_json(old_format)
+        save_results_old_format(results, summary_json, args.out, args.dry_run)
         
-        print(json.dumps(old_format, ensure_ascii=False, indent=2))
+        # Write encoded bytes directly, skipping the text layer
+        sys.stdout.flush()
+        sys.stdout.buffer.write(summary_json + b"\n")
+        sys.stdout.buffer.flush()
         return 0
         
     except Exception as e:
@@ -1,67 +1,293 @@
-import requests
-from typing import List, Dict
+import asyncio
+import httpx
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import os
 import base64
+import hashlib
+import io
+import tarfile
 from dotenv import load_dotenv
 import sys
 import json
 import traceback
 
+try:
+    import orjson  # 선택 사항: 더 빠른 JSON 직렬화
+except ImportError:
+    orjson = None
+
 
 # .env 파일 로드
 load_dotenv()
 
 GITHUB_API_BASE = "https://api.github.com"
 
-# 환경변수에서 토큰 가져오기 (없으면 종료)
+# 가져올 코드 파일 확장자
+CODE_EXTENSIONS = (".js", ".ts")
+
+# 파일 내용 요청 동시 실행 개수
+MAX_CONCURRENT_REQUESTS = 20
+
+# 환경변수에서 토큰 가져오기 (CLI 실행 시 없으면 종료, import 시에는 호출자가 token 전달)
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-if not GITHUB_TOKEN:
-    print("❌ GITHUB_TOKEN이 설정되지 않았습니다. .env 파일에 GITHUB_TOKEN을 추가하세요.")
-    sys.exit(1)
 
-def get_repo_file_list(owner: str, repo: str, branch: str, token: str) -> List[Dict]:
+# ETag 캐시 디렉토리 (tarball/파일별 ETag와 내용을 저장해 조건부 요청에 사용)
+# mcp_server.py와 같은 MCP_GITHUB_CACHE_DIR을 사용하므로 tarball 캐시를 서버와 공유함
+CACHE_DIR = os.getenv(
+    "MCP_GITHUB_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".mcp_cache", "github"),
+)
+
+_http_client: Optional[httpx.AsyncClient] = None
+# 클라이언트를 만든 이벤트 루프 (풀링된 연결은 이 루프에 묶여 있음)
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """현재 이벤트 루프에서 공유하는 AsyncClient (TLS 연결 재사용)
+
+    asyncio.run()을 여러 번 호출하는 경우처럼 루프가 바뀌면, 닫힌 루프에 묶인
+    연결을 재사용하지 않도록 새 클라이언트를 만듭니다.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=100, max_connections=200, keepalive_expiry=30),
+            timeout=30,
+        )
+        _http_client_loop = loop
+    return _http_client
+
+async def close_http_client() -> None:
+    """현재 루프의 공유 AsyncClient 종료 (asyncio.run() 호출자는 종료 전에 호출)"""
+    global _http_client, _http_client_loop
+    if _http_client is not None and _http_client_loop is asyncio.get_running_loop():
+        await _http_client.aclose()
+    _http_client = None
+    _http_client_loop = None
+
+def _cache_key(owner: str, repo: str, branch: str) -> str:
+    """저장소/브랜치별 캐시 파일 이름 (mcp_server.GitHubFetcher와 같은 sha256 해시)
+
+    이름을 그대로 이어 붙이면 "_"가 들어간 이름끼리 충돌하고 "feature/x" 같은
+    브랜치는 없는 하위 디렉토리 경로가 되므로 해시를 사용합니다.
+    """
+    return hashlib.sha256(f"{owner}/{repo}@{branch}".encode("utf-8")).hexdigest()[:32]
+
+def _etag_cache_path(owner: str, repo: str, branch: str) -> str:
+    """저장소/브랜치별 파일 단위 ETag 캐시 파일 경로"""
+    return os.path.join(CACHE_DIR, f"{_cache_key(owner, repo, branch)}.contents.json")
+
+def _tarball_cache_paths(owner: str, repo: str, branch: str) -> Tuple[str, str]:
+    """저장소/브랜치별 (tarball, ETag) 캐시 파일 경로 (mcp_server.GitHubFetcher와 같은 이름)"""
+    key = _cache_key(owner, repo, branch)
+    return os.path.join(CACHE_DIR, f"{key}.tar.gz"), os.path.join(CACHE_DIR, f"{key}.etag")
+
+def _read_cached_tarball(owner: str, repo: str, branch: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """캐시된 (tarball, ETag), 둘 중 하나라도 없으면 (None, None)"""
+    tarball_path, etag_path = _tarball_cache_paths(owner, repo, branch)
+    try:
+        with open(etag_path, "r", encoding="utf-8") as f:
+            etag = f.read().strip()
+        with open(tarball_path, "rb") as f:
+            return f.read(), etag
+    except OSError:
+        return None, None
+
+def _write_cached_tarball(owner: str, repo: str, branch: str, data: bytes, etag: str) -> None:
+    """tarball과 ETag 캐시 저장 (실패해도 무시)"""
+    tarball_path, etag_path = _tarball_cache_paths(owner, repo, branch)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tarball_path, "wb") as f:
+            f.write(data)
+        with open(etag_path, "w", encoding="utf-8") as f:
+            f.write(etag)
+    except OSError as e:
+        print(f"Failed to save tarball cache: {e}", file=sys.stderr)
+
+def load_etag_cache(owner: str, repo: str, branch: str) -> Dict[str, Dict[str, str]]:
+    """ETag 캐시 로드 ({path: {"etag": ..., "content": ...}}), 없거나 손상되면 빈 캐시"""
+    try:
+        with open(_etag_cache_path(owner, repo, branch), "rb") as f:
+            data = f.read()
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+    except (OSError, ValueError):
+        return {}
+
+def save_etag_cache(owner: str, repo: str, branch: str, cache: Dict[str, Dict[str, str]]) -> None:
+    """ETag 캐시 저장"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        data = orjson.dumps(cache) if orjson is not None else json.dumps(cache, ensure_ascii=False).encode("utf-8")
+        with open(_etag_cache_path(owner, repo, branch), "wb") as f:
+            f.write(data)
+    except OSError as e:
+        print(f"Failed to save ETag cache: {e}", file=sys.stderr)
+
+def _in_folder(path: str, prefix: str) -> bool:
+    """path가 prefix 폴더(또는 prefix 파일 자체) 아래에 있는지; "src"는 "src-legacy/..."와 일치하지 않음"""
+    return not prefix or path == prefix or path.startswith(prefix + "/")
+
+async def get_repo_file_list(owner: str, repo: str, branch: str, token: str) -> List[Dict]:
     """브랜치의 전체 파일 목록 가져오기"""
     headers = {"Authorization": f"token {token}"}
     url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
-    response = requests.get(url, headers=headers)
+    response = await get_http_client().get(url, headers=headers)
     response.raise_for_status()
     data = response.json()
     return [file for file in data.get("tree", []) if file.get("type") == "blob"]
 
-def get_file_content(owner: str, repo: str, target_path: str, branch: str, token: str) -> str:
-    """특정 브랜치의 특정 파일 원본 코드 가져오기"""
+async def get_file_content(owner: str, repo: str, target_path: str, branch: str, token: str,
+                           cache: Optional[Dict[str, Dict[str, str]]] = None) -> str:
+    """특정 브랜치의 특정 파일 원본 코드 가져오기
+
+    cache가 주어지면 If-None-Match 조건부 요청을 보내고, 304 응답이면 캐시된 내용을 반환합니다.
+    """
     headers = {"Authorization": f"token {token}"}
+    cached = cache.get(target_path) if cache is not None else None
+    if cached:
+        headers["If-None-Match"] = cached["etag"]
+
     url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/contents/{target_path}?ref={branch}"
-    response = requests.get(url, headers=headers)
+    response = await get_http_client().get(url, headers=headers)
+    if cached and response.status_code == 304:
+        return cached["content"]
     response.raise_for_status()
     content = response.json()
 
     if "content" not in content:
         return ""
-    return base64.b64decode(content["content"]).decode("utf-8", errors="ignore")
+    decoded = base64.b64decode(content["content"]).decode("utf-8", errors="ignore")
+    if cache is not None and response.headers.get("ETag"):
+        cache[target_path] = {"etag": response.headers["ETag"], "content": decoded}
+    return decoded
 
-def fetch_repo_code_files(owner: str, repo: str, branch: str, target_path: str, token: str) -> List[Dict[str, str]]:
+async def fetch_repo_code_files(owner: str, repo: str, branch: str, target_path: str, token: str) -> List[Dict[str, str]]:
     """특정 브랜치와 폴더의 모든 JS/TS 파일 가져오기"""
-    files = get_repo_file_list(owner, repo, branch, token)
+    files = await get_repo_file_list(owner, repo, branch, token)
+
+    # 폴더 필터: target_path가 폴더 경로임 (접두사는 루프 밖에서 한 번만 계산)
+    prefix = target_path.rstrip("/")
+    # 확장자 필터 (필요시 CODE_EXTENSIONS에 확장자 추가 가능)
+    targets = [
+        file["path"] for file in files
+        if file["path"].endswith(CODE_EXTENSIONS) and _in_folder(file["path"], prefix)
+    ]
+
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    cache = load_etag_cache(owner, repo, branch)
+
+    async def fetch(path: str) -> Optional[Dict[str, str]]:
+        async with sem:
+            try:
+                content = await get_file_content(owner, repo, path, branch, token, cache)
+                return {"path": path, "content": content}
+            except Exception as e:
+                print(f"Failed to fetch {path}: {e}", file=sys.stderr)
+                return None
+
+    # 모든 파일 요청을 동시에 보내되 세마포어로 동시 연결 수 제한 (결과 순서는 유지)
+    fetched = await asyncio.gather(*[fetch(path) for path in targets])
+    save_etag_cache(owner, repo, branch, cache)
+    return [item for item in fetched if item is not None]
+
+def _extract_code_files(data: bytes, prefix: str) -> List[Dict[str, str]]:
+    """tarball(gzip)에서 prefix 아래의 JS/TS 파일 추출 (동기, 스레드 풀에서 호출)"""
+    code_files: List[Dict[str, str]] = []
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r|gz") as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            # 최상위 디렉토리(<owner>-<repo>-<sha>/) 제거
+            parts = member.name.split("/", 1)
+            if len(parts) < 2:
+                continue
+            path = parts[1]
+            # 폴더 필터 및 확장자 필터 (Contents API 경로와 동일)
+            if not _in_folder(path, prefix):
+                continue
+            if not path.endswith(CODE_EXTENSIONS):
+                continue
+            extracted = tf.extractfile(member)
+            if extracted is None:
+                continue
+            code_files.append({"path": path, "content": extracted.read().decode("utf-8", errors="ignore")})
+    return code_files
+
+async def iter_repo_code_files_tarball(owner: str, repo: str, branch: str, target_path: str, token: str) -> AsyncIterator[Dict[str, str]]:
+    """tarball 한 번으로 특정 브랜치와 폴더의 JS/TS 파일을 하나씩 yield
+
+    압축 해제는 스레드 풀에서 한 번에 수행하고, 호출자는 결과를 파일 단위로 바로 출력할 수 있습니다.
+    인증/권한 오류(401/403/404) 시 파일별 Contents API 방식으로 대체합니다.
+    """
+    loop = asyncio.get_running_loop()
+    headers = {"Authorization": f"token {token}"}
+    # 캐시된 tarball이 있으면 조건부 요청 (304면 본문 없이 캐시 사용, rate limit 미차감)
+    cached_data, cached_etag = await loop.run_in_executor(None, _read_cached_tarball, owner, repo, branch)
+    if cached_etag:
+        headers["If-None-Match"] = cached_etag
+    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/tarball/{branch}"
+    try:
+        # tarball 엔드포인트는 codeload.github.com 으로 리다이렉트됨
+        response = await get_http_client().get(url, headers=headers, follow_redirects=True, timeout=120)
+        if cached_etag and response.status_code == 304:
+            data = cached_data
+        else:
+            response.raise_for_status()
+            data = response.content
+            if response.headers.get("ETag"):
+                await loop.run_in_executor(
+                    None, _write_cached_tarball, owner, repo, branch, data, response.headers["ETag"]
+                )
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code not in (401, 403, 404):
+            raise
+        print(f"Tarball download failed ({e.response.status_code}), falling back to contents API", file=sys.stderr)
+        for code_file in await fetch_repo_code_files(owner, repo, branch, target_path, token):
+            yield code_file
+        return
 
-    result = []
-    for file in files:
-        # 폴더 필터: target_path가 폴더 경로임
-        if target_path and not file["path"].startswith(target_path.rstrip("/")):
-            continue
-        # 확장자 필터 (필요시 확장자 추가 가능)
-        if not file["path"].endswith((".js", ".ts")):
-            continue
+    # 압축 해제와 디코딩은 CPU 작업이므로 이벤트 루프 밖(스레드 풀)에서 수행
+    code_files = await loop.run_in_executor(None, _extract_code_files, data, target_path.rstrip("/"))
+    for code_file in code_files:
+        yield code_file
 
-        try:
-            content = get_file_content(owner, repo, file["path"], branch, token)
-            result.append({"path": file["path"], "content": content})
-        except Exception as e:
-            print(f"Failed to fetch {file['path']}: {e}", file=sys.stderr)
-    return result
+async def fetch_repo_code_files_tarball(owner: str, repo: str, branch: str, target_path: str, token: str) -> List[Dict[str, str]]:
+    """tarball 한 번으로 특정 브랜치와 폴더의 모든 JS/TS 파일 가져오기"""
+    return [code_file async for code_file in iter_repo_code_files_tarball(owner, repo, branch, target_path, token)]
+
+
+def dumps_json(obj, indent: bool = False) -> bytes:
+    """JSON 직렬화 (orjson 사용 가능 시 orjson, 비ASCII 문자는 그대로 UTF-8로 출력)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
+
+
+async def _main(owner: str, repo: str, branch: str, target_path: str, is_folder_mode: bool) -> None:
+    try:
+        if is_folder_mode:
+            # 파일마다 한 줄(NDJSON)씩 바로 출력해 전체 결과를 메모리에 모으지 않음
+            out = sys.stdout.buffer
+            async for code_file in iter_repo_code_files_tarball(owner, repo, branch, target_path, GITHUB_TOKEN):
+                out.write(dumps_json(code_file) + b"\n")
+                out.flush()
+        else:
+            # 폴더 모드의 Contents API 대체 경로와 같은 ETag 캐시 사용
+            cache = load_etag_cache(owner, repo, branch)
+            content = await get_file_content(owner, repo, target_path, branch, GITHUB_TOKEN, cache)
+            save_etag_cache(owner, repo, branch, cache)
+            sys.stdout.buffer.write(dumps_json({"path": target_path, "content": content}, indent=True) + b"\n")
+    finally:
+        await close_http_client()
 
 
 if __name__ == "__main__":
+    if not GITHUB_TOKEN:
+        print("❌ GITHUB_TOKEN이 설정되지 않았습니다. .env 파일에 GITHUB_TOKEN을 추가하세요.")
+        sys.exit(1)
+
     try:
         if len(sys.argv) < 5:
             print("사용법: python get_github_file.py <owner> <repo> <branch> <target_path> [--folder]")
@@ -74,13 +300,7 @@ if __name__ == "__main__":
 
         is_folder_mode = len(sys.argv) > 5 and sys.argv[5] == "--folder"
 
-        if is_folder_mode:
-            code_files = fetch_repo_code_files(owner, repo, branch, target_path, GITHUB_TOKEN)
-            for code_file in code_files:
-                print(json.dumps(code_file, ensure_ascii=False))
-        else:
-            content = get_file_content(owner, repo, target_path, branch, GITHUB_TOKEN)
-            print(json.dumps({"path": target_path, "content": content}, indent=2, ensure_ascii=False))
+        asyncio.run(_main(owner, repo, branch, target_path, is_folder_mode))
 
     except Exception as e:
         traceback.print_exc()
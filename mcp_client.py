@@ -4,11 +4,12 @@ MCP Client for Security Code Analysis
 """
 
 import asyncio
+import hashlib
 import json
 import sys
 import os
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 import logging
 
 # MCP imports with better error handling
@@ -19,23 +20,77 @@ except ImportError:
     print("MCP package not found. Install with: pip install mcp", file=sys.stderr)
     MCP_AVAILABLE = False
 
+from _runtime import run_with_uvloop
+
+try:
+    import orjson  # optional, faster JSON serialization
+except ImportError:
+    orjson = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Resolved once at import instead of on every call
+MODULE_DIR = Path(__file__).resolve().parent
+SAMPLES_DIR = MODULE_DIR / "samples"
+
+# Language passed to analyze_security, keyed by lowercase file extension
+LANG_BY_EXT = {
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+}
+
+class AnalysisCache:
+    """Exact-match cache of analyze_security results (diskcache-backed when installed)"""
+    
+    def __init__(self, directory: str = ".mcp_cache"):
+        try:
+            import diskcache
+            self._store = diskcache.Cache(directory)
+        except ImportError:
+            logger.warning("diskcache not installed; analysis cache is in-memory only")
+            self._store = {}
+    
+    # Bump to invalidate every stored entry (e.g. after a result format change)
+    VERSION = 2
+    
+    @classmethod
+    def make_key(cls, prompt_name: str, language: str, content: str, template: str = "", model: str = "") -> str:
+        """Key on the template text and model too, so editing a prompt or switching models misses"""
+        template_digest = hashlib.sha256(template.encode("utf-8")).hexdigest()
+        return hashlib.sha256(
+            f"{cls.VERSION}|{model}|{prompt_name}|{template_digest}|{language}|{content}".encode("utf-8")
+        ).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._store.get(key)
+    
+    def set(self, key: str, value: Dict[str, Any]):
+        self._store[key] = value
+
 class SecurityMCPClient:
     """Real MCP client for security analysis"""
     
-    def __init__(self, server_script: str = None):
+    def __init__(self, server_script: str = None, max_concurrency: Optional[int] = None):
         if not MCP_AVAILABLE:
             raise ImportError("MCP package is not available. Please install with: pip install mcp")
         
         if server_script is None:
-            script_dir = Path(__file__).resolve().parent
-            server_script = script_dir / "mcp_server.py"
+            server_script = MODULE_DIR / "mcp_server.py"
         
         self.server_script = Path(server_script)
         self.client = None
         self.connected = False
+        # Opt-in result cache (MCP_CACHE=1) to skip repeated identical analyses
+        self.cache = AnalysisCache() if os.getenv("MCP_CACHE") == "1" else None
+        # Tool and prompt catalogs are static for a session; fetched once per connection
+        self._tools_cache: Optional[List[Dict[str, Any]]] = None
+        self._prompts_cache: Optional[Dict[str, Any]] = None
+        # Optional cap on analyze_security calls in flight over this connection,
+        # shared by every caller (workflows, streams) using the client
+        self._analysis_semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
     
     async def connect(self):
         """Connect to MCP server"""
@@ -60,8 +115,14 @@ class SecurityMCPClient:
             logger.error(f"❌ Failed to connect to MCP server: {e}")
             raise
     
+    def invalidate_cache(self):
+        """Drop cached tool and prompt catalogs so they are re-requested"""
+        self._tools_cache = None
+        self._prompts_cache = None
+    
     async def disconnect(self):
         """Disconnect from MCP server"""
+        self.invalidate_cache()
         if self.client and self.connected:
             try:
                 await self.client.close()
@@ -75,15 +136,19 @@ class SecurityMCPClient:
         if not self.connected:
             raise RuntimeError("Not connected to server")
         
+        if self._tools_cache is not None:
+            return list(self._tools_cache)
+        
         try:
             tools = await self.client.list_tools()
-            return [{"name": tool.name, "description": tool.description} for tool in tools]
+            self._tools_cache = [{"name": tool.name, "description": tool.description} for tool in tools]
+            return list(self._tools_cache)
         except Exception as e:
             logger.error(f"Failed to list tools: {e}")
             raise
     
-    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
-        """Call a tool with arguments"""
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        """Call a tool with arguments (batch_analyze results come back as a list)"""
         if not self.connected:
             raise RuntimeError("Not connected to server")
         
@@ -91,19 +156,34 @@ class SecurityMCPClient:
             result = await self.client.call_tool(name, arguments)
             # Extract text content from result
             if result and len(result) > 0:
-                content = result[0].text if hasattr(result[0], 'text') else str(result[0])
-                return json.loads(content)
+                items = [
+                    json.loads(item.text if hasattr(item, 'text') else str(item))
+                    for item in result
+                ]
+                if name == "batch_analyze":
+                    # One item per file (or a single empty list); merge into one list
+                    merged = []
+                    for item in items:
+                        merged.extend(item if isinstance(item, list) else [item])
+                    return merged
+                return items[0]
             return {}
         except Exception as e:
             logger.error(f"Failed to call tool {name}: {e}")
             raise
     
     async def load_prompts(self, prompts_dir: str = None) -> Dict[str, Any]:
-        """Load security analysis prompts"""
+        """Load security analysis prompts (cached until a new prompts_dir is given)"""
+        if not prompts_dir and self._prompts_cache is not None:
+            return self._prompts_cache
+        
         args = {}
         if prompts_dir:
             args["prompts_dir"] = prompts_dir
-        return await self.call_tool("load_prompts", args)
+        # Passing prompts_dir switches the server's loader, so the result
+        # becomes the new default set either way
+        self._prompts_cache = await self.call_tool("load_prompts", args)
+        return self._prompts_cache
     
     async def read_local_files(self, folder_path: str) -> Dict[str, Any]:
         """Read local files from directory"""
@@ -118,16 +198,68 @@ class SecurityMCPClient:
     
     async def analyze_security(self, file_path: str, content: str, language: str, prompt_name: str) -> Dict[str, Any]:
         """Analyze code for security vulnerabilities"""
+        cache_key = None
+        if self.cache is not None:
+            # The server resolves prompt_name against the same (cached) prompt set
+            prompts = (await self.load_prompts()).get("prompts", [])
+            template = next((p["content"] for p in prompts if p["name"] == prompt_name), "")
+            cache_key = AnalysisCache.make_key(
+                prompt_name, language, content, template, os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                # Identical content may live in another file; report this one's path
+                return {**cached, "file_path": file_path}
+        
         args = {
             "file_path": file_path,
             "content": content,
             "language": language,
             "prompt_name": prompt_name
         }
-        return await self.call_tool("analyze_security", args)
+        if self._analysis_semaphore is not None:
+            async with self._analysis_semaphore:
+                result = await self.call_tool("analyze_security", args)
+        else:
+            result = await self.call_tool("analyze_security", args)
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        return result
+    
+    async def analyze_security_stream(self, files: List[Dict[str, Any]], prompt_name: str,
+                                      max_concurrency: int = 8) -> AsyncIterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Analyze files with one prompt, yielding (file_info, analysis) as each completes
+
+        Callers can process early results while slower analyses are still running.
+        Remaining analyses are cancelled when the generator is closed; a caller
+        that may stop early (break) should close it promptly, e.g.
+        ``async with contextlib.aclosing(client.analyze_security_stream(...))``
+        (Python 3.10+) or ``await stream.aclose()``, instead of waiting for GC.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def analyze(file_info: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+            async with semaphore:
+                analysis = await self.analyze_security(
+                    file_info["path"],
+                    file_info["content"],
+                    file_info["language"],
+                    prompt_name
+                )
+                return file_info, analysis
+        
+        tasks = [asyncio.ensure_future(analyze(file_info)) for file_info in files]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Reap the cancelled tasks so none is left pending or with an unretrieved exception
+            await asyncio.gather(*tasks, return_exceptions=True)
     
-    async def batch_analyze(self, source_type: str, **kwargs) -> Dict[str, Any]:
-        """Perform batch analysis"""
+    async def batch_analyze(self, source_type: str, **kwargs) -> List[Dict[str, Any]]:
+        """Perform batch analysis; one {"file_path", "analyses"} entry per file"""
         args = {"source_type": source_type}
         args.update(kwargs)
         return await self.call_tool("batch_analyze", args)
@@ -135,37 +267,75 @@ class SecurityMCPClient:
 class SecurityAnalysisWorkflow:
     """High-level workflow for security analysis"""
     
-    def __init__(self, client: SecurityMCPClient):
+    def __init__(self, client: SecurityMCPClient, max_concurrency: int = 16):
         self.client = client
+        self.max_concurrency = max_concurrency
     
-    async def analyze_local_folder(self, folder_path: str, max_files: int = 10) -> Dict[str, Any]:
-        """Analyze all files in a local folder"""
-        # Read files
-        files_result = await self.client.read_local_files(folder_path)
+    async def _prompts(self) -> Dict[str, Any]:
+        """Load prompts (cached on the client) for use across analyses"""
+        return await self.client.load_prompts()
+    
+    def invalidate_prompts(self):
+        """Drop cached prompts so the next analysis reloads them from the server"""
+        self.client.invalidate_cache()
+    
+    async def _analyze_files(self, files: List[Dict[str, Any]], prompts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Analyze every (file, prompt) pair concurrently, grouped back per file"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
         
-        # Load prompts
-        prompts_result = await self.client.load_prompts()
+        # Infer language once per file from its extension; shallow copies, since
+        # callers (e.g. concurrent test suites) may share the input dicts
+        files = [
+            {**file_info, "language": LANG_BY_EXT.get(
+                os.path.splitext(file_info["path"])[1].lower(), file_info.get("language", "unknown")
+            )}
+            for file_info in files
+        ]
         
-        # Analyze files
-        results = []
-        for file_info in files_result.get("files", [])[:max_files]:
-            file_results = []
-            for prompt in prompts_result.get("prompts", []):
+        async def analyze(file_info: Dict[str, Any], prompt: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
                 try:
-                    analysis = await self.client.analyze_security(
+                    return await self.client.analyze_security(
                         file_info["path"],
                         file_info["content"],
                         file_info["language"],
                         prompt["name"]
                     )
-                    file_results.append(analysis)
                 except Exception as e:
-                    file_results.append({"error": str(e), "prompt_name": prompt["name"]})
-            
+                    return {"error": str(e), "prompt_name": prompt["name"]}
+        
+        analyses = await asyncio.gather(
+            *[analyze(file_info, prompt) for file_info in files for prompt in prompts]
+        )
+        
+        # Slice the flat result list back into per-file groups of len(prompts)
+        results = []
+        for i, file_info in enumerate(files):
             results.append({
                 "file_path": file_info["path"],
-                "analyses": file_results
+                "analyses": list(analyses[i * len(prompts):(i + 1) * len(prompts)])
             })
+        return results
+    
+    async def analyze_local_folder(self, folder_path: str, max_files: int = 10,
+                                   files_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Analyze all files in a local folder
+
+        files_result may carry an earlier read_local_files result for the same
+        folder to skip reading it again.
+        """
+        # Read files
+        if files_result is None:
+            files_result = await self.client.read_local_files(folder_path)
+        
+        # Load prompts (cached on the client)
+        prompts_result = await self._prompts()
+        
+        # Analyze files
+        results = await self._analyze_files(
+            files_result.get("files", [])[:max_files],
+            prompts_result.get("prompts", [])
+        )
         
         return {
             "folder": folder_path,
@@ -179,29 +349,14 @@ class SecurityAnalysisWorkflow:
         # Fetch files
         files_result = await self.client.fetch_github_code(owner, repo, branch, folder)
         
-        # Load prompts
-        prompts_result = await self.client.load_prompts()
+        # Load prompts (cached on the client)
+        prompts_result = await self._prompts()
         
         # Analyze files
-        results = []
-        for file_info in files_result.get("files", [])[:max_files]:
-            file_results = []
-            for prompt in prompts_result.get("prompts", []):
-                try:
-                    analysis = await self.client.analyze_security(
-                        file_info["path"],
-                        file_info["content"],
-                        file_info["language"],
-                        prompt["name"]
-                    )
-                    file_results.append(analysis)
-                except Exception as e:
-                    file_results.append({"error": str(e), "prompt_name": prompt["name"]})
-            
-            results.append({
-                "file_path": file_info["path"],
-                "analyses": file_results
-            })
+        results = await self._analyze_files(
+            files_result.get("files", [])[:max_files],
+            prompts_result.get("prompts", [])
+        )
         
         return {
             "repository": f"{owner}/{repo}",
@@ -213,7 +368,18 @@ class SecurityAnalysisWorkflow:
         }
     
     async def save_results(self, results: Dict[str, Any], output_file: str):
-        """Save analysis results to file"""
+        """Save analysis results to file without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._sync_save, results, output_file)
+    
+    @staticmethod
+    def _sync_save(results: Dict[str, Any], output_file: str):
+        if orjson is not None:
+            # orjson encodes in C straight to UTF-8 bytes, several times faster than json
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+            return
+        # json.dump encodes incrementally into the file, never building the whole string
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
 
@@ -222,8 +388,7 @@ class SimpleMCPDemo:
     
     def __init__(self, server_script: str = None):
         if server_script is None:
-            script_dir = Path(__file__).resolve().parent
-            server_script = script_dir / "mcp_server.py"
+            server_script = MODULE_DIR / "mcp_server.py"
         
         self.server_script = Path(server_script)
     
@@ -276,13 +441,13 @@ class SimpleMCPDemo:
             prompt_file = prompts[0] if prompts else None
             
             if sample_file and prompt_file:
-                sample_content = sample_file.read_text(encoding='utf-8')
-                prompt_content = prompt_file.read_text(encoding='utf-8')
+                sample_size = sample_file.stat().st_size
+                prompt_size = prompt_file.stat().st_size
                 
                 print(f"   📄 Analyzing: {sample_file.name}")
                 print(f"   🎯 Using prompt: {prompt_file.name}")
-                print(f"   📊 Code size: {len(sample_content)} characters")
-                print(f"   🔬 Prompt size: {len(prompt_content)} characters")
+                print(f"   📊 Code size: {sample_size} bytes")
+                print(f"   🔬 Prompt size: {prompt_size} bytes")
                 
                 print(f"\n   💡 Analysis would detect:")
                 print(f"      • SQL Injection vulnerabilities")
@@ -319,7 +484,7 @@ def show_mcp_architecture():
     print(f"\n📊 MCP Architecture Analysis:")
     print(f"=" * 50)
     
-    base_dir = Path(__file__).parent
+    base_dir = MODULE_DIR
     
     # Check each component
     components = {
@@ -344,17 +509,23 @@ def show_mcp_architecture():
     print(f"⚠️  Client Connection: Needs fixing")
     print(f"💡 Overall: 90% functional")
 
-async def test_real_mcp_client():
-    """Test the real MCP client connection"""
+async def test_real_mcp_client(client: Optional[SecurityMCPClient] = None):
+    """Test the real MCP client connection
+    
+    Pass an already-connected client to reuse its server session; otherwise a
+    client is created, connected and disconnected here.
+    """
     if not MCP_AVAILABLE:
         print("❌ MCP package not available. Install with: pip install mcp")
         return False
     
     print("🔌 Testing Real MCP Client Connection\n")
     
+    owns_client = client is None
     try:
-        client = SecurityMCPClient()
-        await client.connect()
+        if owns_client:
+            client = SecurityMCPClient()
+            await client.connect()
         
         # Test basic functionality
         print("📋 Testing tool listing...")
@@ -369,19 +540,22 @@ async def test_real_mcp_client():
         print(f"✅ Loaded {prompts.get('prompts_loaded', 0)} prompts")
         
         # Test local file reading (if samples exist)
-        samples_dir = Path(__file__).parent / "samples"
+        samples_dir = SAMPLES_DIR
         if samples_dir.exists():
             print(f"\n📁 Testing local file reading...")
             files = await client.read_local_files(str(samples_dir))
             print(f"✅ Found {files.get('files_found', 0)} files")
         
-        await client.disconnect()
         print("\n🎉 Real MCP client test successful!")
         return True
         
     except Exception as e:
         print(f"\n❌ Real MCP client test failed: {e}")
         return False
+    
+    finally:
+        if owns_client and client is not None:
+            await client.disconnect()
 
 async def main():
     """Main function"""
@@ -419,4 +593,4 @@ async def main():
         print(f"🔧 Install MCP package for full functionality")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_with_uvloop(main())
@@ -4,12 +4,20 @@ MCP Server for Security Code Analysis
 """
 
 import asyncio
+import hashlib
+import io
 import json
 import os
 import sys
+import tarfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, replace
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import logging
 import re  # for JSON extraction / code block parsing
 
@@ -36,13 +44,93 @@ try:
 except Exception:
     InitializationOptions = None  # final fallback for older SDKs
 
+try:
+    import orjson  # optional, faster JSON encode/decode
+except ImportError:
+    orjson = None
+
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from _runtime import run_with_uvloop
+
+if TYPE_CHECKING:
+    # openai is imported on first analysis; it is slow to import and unused by
+    # the fetch/read/prompt tools
+    from openai import AsyncOpenAI
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+def _dumps_json(obj: Any, indent: bool = True) -> str:
+    """Serialize to JSON text (orjson when available), compact when indent is False"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
+    if indent:
+        return json.dumps(obj, indent=2)
+    return json.dumps(obj, separators=(",", ":"))
+
+def _loads_json(text: str) -> Any:
+    """Parse JSON text (orjson when available); raises json.JSONDecodeError on bad input"""
+    if orjson is not None:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        return orjson.loads(text)
+    return json.loads(text)
+
+# Resolved once at import instead of on every PromptLoader construction
+MODULE_DIR = Path(__file__).resolve().parent
+PROMPTS_DIR = MODULE_DIR / "prompts"
+
+# Attempts per GitHub request when rate limited (403/429)
+GITHUB_MAX_RETRIES = 3
+
+# GitHub blobs larger than this are skipped before fetching (override with MCP_GITHUB_MAX_FILE_BYTES)
+GITHUB_MAX_FILE_BYTES = int(os.getenv("MCP_GITHUB_MAX_FILE_BYTES", str(256 * 1024)))
+
+# Minified bundles and vendored/build output are not worth analyzing
+_MINIFIED_RE = re.compile(r"\.min\.(js|ts)$")
+_VENDOR_DIRS = ("node_modules/", "dist/", "build/")
+
+# Trees and tarballs are cached here and revalidated by ETag, blobs by sha (override with MCP_GITHUB_CACHE_DIR)
+GITHUB_CACHE_DIR = Path(os.getenv("MCP_GITHUB_CACHE_DIR", str(MODULE_DIR / ".mcp_cache" / "github")))
+
+# Least recently used GitHub cache files are pruned above this total size
+# (override with MCP_GITHUB_CACHE_MAX_BYTES, 0 for no limit)
+GITHUB_CACHE_MAX_BYTES = int(os.getenv("MCP_GITHUB_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Analyses kept in SecurityAnalyzer's in-memory LRU cache (override with MCP_ANALYSIS_CACHE_SIZE, 0 disables)
+ANALYSIS_CACHE_SIZE = int(os.getenv("MCP_ANALYSIS_CACHE_SIZE", "1024"))
+
+# Local files above this size are truncated when read (override with MCP_MAX_FILE_BYTES)
+MAX_FILE_BYTES = int(os.getenv("MCP_MAX_FILE_BYTES", str(1 << 20)))
+
+# Precompiled patterns for parsing model responses
+_FIRST_OBJ_RE = re.compile(r"(\{[\s\S]*\})")
+_CODE_BLOCK_RE = re.compile(r"```(?:javascript|js|typescript|ts)?\s*([\s\S]*?)```")
+
+# Stands in for code placeholders in prompt templates (code is sent in the system message)
+_CODE_REFERENCE = "[the code in the file provided above]"
+
+# All prompt template placeholders (capturing, so re.split keeps them)
+_PLACEHOLDER_RE = re.compile(r"(\{CODE HERE\}|\{\}|/index\.js|/server\.js)")
+_CODE_PLACEHOLDERS = ("{CODE HERE}", "{}")
+
+@lru_cache(maxsize=64)
+def _split_prompt_template(prompt_template: str) -> Tuple[str, ...]:
+    """Split a template once into alternating literal text / placeholder parts"""
+    return tuple(_PLACEHOLDER_RE.split(prompt_template))
+
+def fill_prompt_placeholders(prompt_template: str, file_path: str) -> str:
+    """Replace code and file-path placeholders by joining the pre-split template parts"""
+    parts = _split_prompt_template(prompt_template)
+    # Odd indices are placeholders, even indices are literal text; a list (not a
+    # generator) since str.join would materialize one anyway
+    return "".join([
+        part if i % 2 == 0 else (_CODE_REFERENCE if part in _CODE_PLACEHOLDERS else file_path)
+        for i, part in enumerate(parts)
+    ])
+
 @dataclass
 class SecurityAnalysisResult:
     """Result of security analysis"""
@@ -61,196 +149,738 @@ class CodeFile:
     content: str
     language: str
 
+def _codefile_to_dict(f: CodeFile) -> Dict[str, str]:
+    """CodeFile as a dict without asdict()'s recursive deep copy"""
+    return {"path": f.path, "content": f.content, "language": f.language}
+
+def _result_to_dict(r: SecurityAnalysisResult) -> Dict[str, Any]:
+    """SecurityAnalysisResult as a dict without asdict()'s recursive deep copy"""
+    return {
+        "file_path": r.file_path,
+        "vulnerability_type": r.vulnerability_type,
+        "severity": r.severity,
+        "description": r.description,
+        "fixed_code": r.fixed_code,
+        "findings": r.findings,
+        "prompt_used": r.prompt_used,
+    }
+
+def _skip_repo_file(path: str, size: int, max_file_bytes: int, skip_vendor: bool) -> bool:
+    """Whether a repository file should be skipped (oversized, minified or vendored)"""
+    if max_file_bytes and size > max_file_bytes:
+        return True
+    if skip_vendor:
+        if _MINIFIED_RE.search(path):
+            return True
+        if path.startswith(_VENDOR_DIRS) or any(f"/{d}" in path for d in _VENDOR_DIRS):
+            return True
+    return False
+
+def _in_folder(path: str, prefix: str) -> bool:
+    """Whether path is prefix or lies under it ("src" does not match "src-legacy/...")"""
+    return not prefix or path == prefix or path.startswith(prefix + "/")
+
+def _github_tokens() -> List[str]:
+    """GITHUB_TOKEN plus any GITHUB_TOKEN_2, GITHUB_TOKEN_3, ... set in the environment"""
+    tokens = []
+    token = os.getenv("GITHUB_TOKEN")
+    index = 2
+    while token:
+        tokens.append(token)
+        token = os.getenv(f"GITHUB_TOKEN_{index}")
+        index += 1
+    return tokens
+
+class _TokenBudget:
+    """Rate limit state reported by GitHub for one token"""
+
+    def __init__(self, token: str):
+        self.token = token
+        self.remaining: Optional[int] = None  # unknown until the first response
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+
+    def available_at(self, now: float) -> float:
+        """Earliest time a request may be sent with this token"""
+        at = self.blocked_until
+        if self.remaining is not None and self.remaining <= 0:
+            at = max(at, self.reset_at)
+        return at if at > now else now
+
+class GitHubRateLimiter:
+    """Gates GitHub requests on the X-RateLimit-* and Retry-After response headers
+
+    Tokens are used round-robin, each with its own budget, so several tokens
+    (GITHUB_TOKEN, GITHUB_TOKEN_2, ...) multiply the available request rate.
+    """
+
+    def __init__(self, tokens: List[str]):
+        self._budgets = [_TokenBudget(token) for token in tokens]
+        self._next = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> str:
+        """Wait until some token has budget left, reserve one request and return the token"""
+        async with self._cond:
+            waited = False
+            while True:
+                now = time.time()
+                count = len(self._budgets)
+                for offset in range(count):
+                    budget = self._budgets[(self._next + offset) % count]
+                    if budget.available_at(now) <= now:
+                        self._next = (self._next + offset + 1) % count
+                        if budget.remaining is not None:
+                            if budget.reset_at <= now:
+                                budget.remaining = None  # window has rolled over
+                            else:
+                                budget.remaining -= 1
+                        return budget.token
+
+                wait = min(budget.available_at(now) for budget in self._budgets) - now
+                if not waited:
+                    logger.warning(f"GitHub rate limit reached; waiting up to {wait:.1f}s")
+                    waited = True
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def update(self, token: str, headers: Any) -> None:
+        """Record the rate limit state GitHub reported for a response sent with token"""
+        now = time.time()
+        async with self._cond:
+            budget = next((b for b in self._budgets if b.token == token), None)
+            if budget is None:
+                return
+
+            if "X-RateLimit-Remaining" in headers and "X-RateLimit-Reset" in headers:
+                remaining = int(headers["X-RateLimit-Remaining"])
+                reset_at = float(headers["X-RateLimit-Reset"])
+                if reset_at != budget.reset_at or budget.remaining is None:
+                    budget.remaining, budget.reset_at = remaining, reset_at
+                else:
+                    # Responses can arrive out of order within a window
+                    budget.remaining = min(budget.remaining, remaining)
+                if remaining < 10:
+                    logger.warning(f"GitHub API rate limit low: {remaining} requests remaining")
+
+            retry_after = headers.get("Retry-After")
+            if retry_after:
+                budget.blocked_until = max(budget.blocked_until, now + int(retry_after))
+
+            self._cond.notify_all()
+
 class GitHubFetcher:
     """GitHub code fetcher tool"""
 
-    def __init__(self):
+    def __init__(self, max_concurrency: int = 8, cache_dir: Optional[Path] = None,
+                 client: Optional[httpx.AsyncClient] = None):
         self.github_token = os.getenv("GITHUB_TOKEN")
+        self.max_concurrency = max_concurrency
+        # Long-lived client owned by the caller; without one each fetch opens its own
+        self.client = client
+        self.cache_dir = Path(cache_dir) if cache_dir else GITHUB_CACHE_DIR
+        # Set by cache writes; the next fetch to finish prunes the cache
+        self._cache_dirty = False
+        # Shared by every fetch so concurrent calls draw on the same budgets
+        self.rate_limiter = GitHubRateLimiter(_github_tokens())
         if not self.github_token:
             logger.warning("GITHUB_TOKEN not set. GitHub functionality will be limited.")
 
-    async def fetch_repo_files(self, owner: str, repo: str, branch: str, folder: str = "") -> List[CodeFile]:
-        """Fetch JS/TS files from GitHub repository"""
-        if not self.github_token:
-            raise ValueError("GITHUB_TOKEN is required for GitHub operations")
-
-        import requests
-        import base64
-        import time
+    async def _get(self, client: httpx.AsyncClient, url: str, headers: Optional[Dict[str, str]] = None,
+                   **kwargs) -> httpx.Response:
+        """GET through the rate limiter, retrying when GitHub rate limits (403/429)"""
+        for attempt in range(GITHUB_MAX_RETRIES):
+            token = await self.rate_limiter.acquire()
+            request_headers = {"Authorization": f"token {token}", **(headers or {})}
+            response = await client.get(url, headers=request_headers, **kwargs)
+            await self.rate_limiter.update(token, response.headers)
+
+            rate_limited = response.status_code in (403, 429) and (
+                "Retry-After" in response.headers
+                or response.headers.get("X-RateLimit-Remaining") == "0"
+            )
+            if rate_limited and attempt < GITHUB_MAX_RETRIES - 1:
+                # acquire() holds the retry back until the limit has cleared
+                logger.warning(f"GitHub rate limited; retrying {url}")
+                continue
+            return response
+        return response
+
+    @asynccontextmanager
+    async def _client(self):
+        """Yield the shared HTTP client, or a temporary one closed afterwards"""
+        if self.client is not None:
+            yield self.client
+        else:
+            async with httpx.AsyncClient(timeout=30) as client:
+                yield client
+
+    def _cache_key(self, owner: str, repo: str, branch: str) -> str:
+        """File name stem for a repository branch's cache entries"""
+        return hashlib.sha256(f"{owner}/{repo}@{branch}".encode("utf-8")).hexdigest()[:32]
+
+    def _tarball_cache_paths(self, owner: str, repo: str, branch: str) -> Tuple[Path, Path]:
+        """(tarball, etag) cache file paths for a repository branch"""
+        key = self._cache_key(owner, repo, branch)
+        return self.cache_dir / f"{key}.tar.gz", self.cache_dir / f"{key}.etag"
+
+    def _blob_cache_path(self, sha: str) -> Path:
+        """Cache path for a blob; blobs are content-addressed, so entries never go stale"""
+        return self.cache_dir / "blobs" / sha[:2] / sha
+
+    def _write_cache(self, path: Path, data: bytes) -> None:
+        """Best-effort cache write"""
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            self._cache_dirty = True
+        except OSError as e:
+            logger.warning(f"Could not write GitHub cache entry {path}: {e}")
 
-        headers = {"Authorization": f"token {self.github_token}"}
-        url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
+    def _read_cache(self, path: Path) -> Optional[bytes]:
+        """Cached bytes, or None when the entry is missing or unreadable
 
+        A hit bumps the file's mtime, which _prune_cache uses as its LRU order.
+        """
         try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            # Check rate limit
-            if 'X-RateLimit-Remaining' in response.headers:
-                remaining = int(response.headers['X-RateLimit-Remaining'])
-                if remaining < 10:
-                    logger.warning(f"GitHub API rate limit low: {remaining} requests remaining")
-            
-            data = response.json()
-        except requests.exceptions.Timeout:
-            raise ValueError(f"GitHub API request timed out for {owner}/{repo}")
-        except requests.exceptions.RequestException as e:
-            raise ValueError(f"GitHub API request failed: {e}")
-        except Exception as e:
-            raise ValueError(f"Unexpected error fetching repository: {e}")
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _prune_cache(self) -> None:
+        """Delete least recently used cache files until the total fits GITHUB_CACHE_MAX_BYTES"""
+        if GITHUB_CACHE_MAX_BYTES <= 0:
+            return
+        entries = []
+        total = 0
+        for dirpath, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= GITHUB_CACHE_MAX_BYTES:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= GITHUB_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        logger.info(f"Pruned GitHub cache {self.cache_dir} to {total} bytes")
+
+    def _read_etag(self, data_path: Path, etag_path: Path) -> Optional[str]:
+        """Stored ETag for a cached entry, or None unless both files exist"""
+        if not data_path.exists():
+            return None
+        data = self._read_cache(etag_path)
+        return data.decode("utf-8").strip() if data else None
+
+    async def _cache_io(self, func, *args) -> Any:
+        """Run a cache read/write on the I/O pool; tarballs can be several MB"""
+        return await asyncio.get_running_loop().run_in_executor(_get_io_executor(), func, *args)
+
+    async def _get_tree(self, client: httpx.AsyncClient, owner: str, repo: str, branch: str) -> Dict[str, Any]:
+        """Fetch the recursive tree, revalidating a cached copy by ETag
+
+        A 304 carries no body and does not count against the primary rate limit.
+        """
+        key = self._cache_key(owner, repo, branch)
+        tree_path = self.cache_dir / f"{key}.tree.json"
+        etag_path = self.cache_dir / f"{key}.tree.etag"
+        headers = {}
+        cached_etag = await self._cache_io(self._read_etag, tree_path, etag_path)
+        if cached_etag:
+            headers["If-None-Match"] = cached_etag
 
-        files: List[CodeFile] = []
-        for file_info in data.get("tree", []):
-            if file_info.get("type") != "blob":
-                continue
+        url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
+        response = await self._get(client, url, headers=headers)
+        if response.status_code == 304:
+            cached = await self._cache_io(self._read_cache, tree_path)
+            if cached is not None:
+                logger.info(f"Tree for {owner}/{repo}@{branch} unchanged, using cached copy")
+                return _loads_json(cached)
+            # Pruned since the ETag was read; fetch it in full
+            response = await self._get(client, url)
+        response.raise_for_status()
+
+        etag = response.headers.get("ETag")
+        if etag:
+            await self._cache_io(self._write_cache, tree_path, response.content)
+            await self._cache_io(self._write_cache, etag_path, etag.encode("utf-8"))
+        return response.json()
+
+    async def _download_tarball(self, client: httpx.AsyncClient, owner: str, repo: str, branch: str) -> Optional[bytes]:
+        """Download the branch tarball, revalidating a cached copy by ETag; None on 404"""
+        tarball_path, etag_path = self._tarball_cache_paths(owner, repo, branch)
+        headers = {}
+        cached_etag = await self._cache_io(self._read_etag, tarball_path, etag_path)
+        if cached_etag:
+            headers["If-None-Match"] = cached_etag
+
+        url = f"https://api.github.com/repos/{owner}/{repo}/tarball/{branch}"
+        # The API redirects to codeload.github.com for the archive itself
+        response = await self._get(client, url, headers=headers, follow_redirects=True, timeout=120)
+        if response.status_code == 304:
+            cached = await self._cache_io(self._read_cache, tarball_path)
+            if cached is not None:
+                logger.info(f"Using cached tarball for {owner}/{repo}@{branch}")
+                return cached
+            # Pruned since the ETag was read; fetch it in full
+            response = await self._get(client, url, follow_redirects=True, timeout=120)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+
+        data = response.content
+        etag = response.headers.get("ETag")
+        if etag:
+            await self._cache_io(self._write_cache, tarball_path, data)
+            await self._cache_io(self._write_cache, etag_path, etag.encode("utf-8"))
+        return data
+
+    async def _fetch_tarball_files(self, client: httpx.AsyncClient, owner: str, repo: str, branch: str, folder: str,
+                                   max_file_bytes: int, skip_vendor: bool) -> Optional[List[CodeFile]]:
+        """Fetch JS/TS files from a single branch tarball; None if the tarball is unavailable"""
+        data = await self._download_tarball(client, owner, repo, branch)
+        if data is None:
+            return None
+        # Decompression and decoding are CPU bound, keep them off the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            _get_io_executor(), _extract_code_files, data, folder.rstrip("/"), max_file_bytes, skip_vendor
+        )
 
-            file_path = file_info["path"]
+    async def fetch_repo_files(self, owner: str, repo: str, branch: str, folder: str = "",
+                               use_tarball: bool = False, max_file_bytes: Optional[int] = None,
+                               skip_vendor: bool = True) -> List[CodeFile]:
+        """Fetch JS/TS files from GitHub repository
+
+        With use_tarball, the whole branch is downloaded as one archive instead of
+        one API call per file, falling back to per-blob requests on 404.
+        Files over max_file_bytes (default GITHUB_MAX_FILE_BYTES, 0 for no limit)
+        and, with skip_vendor, minified or node_modules/dist/build files are skipped.
+        The on-disk cache is pruned to GITHUB_CACHE_MAX_BYTES after a fetch writes to it.
+        """
+        try:
+            return await self._fetch_repo_files(
+                owner, repo, branch, folder, use_tarball, max_file_bytes, skip_vendor
+            )
+        finally:
+            if self._cache_dirty:
+                self._cache_dirty = False
+                await self._cache_io(self._prune_cache)
+
+    async def _fetch_repo_files(self, owner: str, repo: str, branch: str, folder: str,
+                                use_tarball: bool, max_file_bytes: Optional[int],
+                                skip_vendor: bool) -> List[CodeFile]:
+        """fetch_repo_files without the cache pruning"""
+        if max_file_bytes is None:
+            max_file_bytes = GITHUB_MAX_FILE_BYTES
+        if not self.github_token:
+            raise ValueError("GITHUB_TOKEN is required for GitHub operations")
 
-            # Filter by folder and extension
-            if folder and not file_path.startswith(folder.rstrip("/")):
-                continue
-            if not file_path.endswith((".js", ".ts")):
-                continue
+        async with self._client() as client:
+            if use_tarball:
+                try:
+                    files = await self._fetch_tarball_files(
+                        client, owner, repo, branch, folder, max_file_bytes, skip_vendor
+                    )
+                except httpx.HTTPError as e:
+                    raise ValueError(f"GitHub tarball download failed: {e}")
+                if files is not None:
+                    logger.info(f"Successfully fetched {len(files)} files from {owner}/{repo} tarball")
+                    return files
+                logger.warning(f"Tarball not found for {owner}/{repo}@{branch}, falling back to blob API")
 
             try:
-                # Get file content
-                content_url = f"https://api.github.com/repos/{owner}/{repo}/contents/{file_path}?ref={branch}"
-                content_response = requests.get(content_url, headers=headers, timeout=30)
-                content_response.raise_for_status()
-                content_data = content_response.json()
-
-                if "content" not in content_data:
-                    logger.warning(f"No content found for {file_path}")
-                    continue
-
-                content = base64.b64decode(content_data["content"]).decode("utf-8", errors="ignore")
+                data = await self._get_tree(client, owner, repo, branch)
+            except httpx.TimeoutException:
+                raise ValueError(f"GitHub API request timed out for {owner}/{repo}")
+            except httpx.HTTPError as e:
+                raise ValueError(f"GitHub API request failed: {e}")
+            except Exception as e:
+                raise ValueError(f"Unexpected error fetching repository: {e}")
+
+            # Filter by folder, extension and size; the tree already carries each
+            # blob's sha and size, so skipped files cost no request
+            targets = [
+                (file_info["path"], file_info["sha"]) for file_info in data.get("tree", [])
+                if file_info.get("type") == "blob"
+                and _in_folder(file_info["path"], folder.rstrip("/"))
+                and file_info["path"].endswith((".js", ".ts"))
+                and not _skip_repo_file(file_info["path"], file_info.get("size", 0), max_file_bytes, skip_vendor)
+            ]
 
-                files.append(CodeFile(
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def fetch_one(file_path: str, sha: str) -> CodeFile:
+                blob_path = self._blob_cache_path(sha)
+                raw = await self._cache_io(self._read_cache, blob_path)
+                if raw is None:
+                    async with semaphore:
+                        blob_url = f"https://api.github.com/repos/{owner}/{repo}/git/blobs/{sha}"
+                        # Raw media type: the body is the file itself, not base64 inside JSON
+                        blob_response = await self._get(client, blob_url, headers={"Accept": "application/vnd.github.raw+json"})
+                        blob_response.raise_for_status()
+                    raw = blob_response.content
+                    await self._cache_io(self._write_cache, blob_path, raw)
+
+                return CodeFile(
                     path=file_path,
-                    content=content,
+                    content=raw.decode("utf-8", errors="ignore"),
                     language="javascript" if file_path.endswith(".js") else "typescript"
-                ))
-                
-                # Rate limiting: small delay between requests
-                time.sleep(0.1)
-                
-            except Exception as e:
-                logger.warning(f"Failed to fetch content for {file_path}: {e}")
-                continue
+                )
+
+            # Fetch blobs concurrently (bounded by the semaphore)
+            fetched = await asyncio.gather(*[fetch_one(p, sha) for p, sha in targets], return_exceptions=True)
+
+        files: List[CodeFile] = []
+        for (file_path, _), result in zip(targets, fetched):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to fetch content for {file_path}: {result}")
+            else:
+                files.append(result)
 
         logger.info(f"Successfully fetched {len(files)} files from {owner}/{repo}")
         return files
 
+def _extract_code_files(data: bytes, prefix: str, max_file_bytes: int = 0, skip_vendor: bool = False) -> List[CodeFile]:
+    """Extract JS/TS files under prefix from a GitHub tarball (gzip, streamed)"""
+    files: List[CodeFile] = []
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r|gz") as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            # Strip the archive's top-level <owner>-<repo>-<sha>/ directory
+            parts = member.name.split("/", 1)
+            if len(parts) < 2:
+                continue
+            path = parts[1]
+            if not _in_folder(path, prefix):
+                continue
+            if not path.endswith((".js", ".ts")):
+                continue
+            if _skip_repo_file(path, member.size, max_file_bytes, skip_vendor):
+                continue
+            extracted = tf.extractfile(member)
+            if extracted is None:
+                continue
+            files.append(CodeFile(
+                path=path,
+                content=extracted.read().decode("utf-8", errors="ignore"),
+                language="javascript" if path.endswith(".js") else "typescript"
+            ))
+    return files
+
+# Every case variant of the JS/TS suffixes, so names can be matched with a
+# single str.endswith call instead of lower()/Path.suffix per entry
+_JS_SUFFIXES = (".js", ".jS", ".Js", ".JS")
+_CODE_SUFFIXES = _JS_SUFFIXES + (".ts", ".tS", ".Ts", ".TS")
+
+def _iter_code_files(root: str) -> Iterator[str]:
+    """Yield paths of JS/TS files under root using os.scandir (no per-entry Path objects)
+
+    Same order as the Path.rglob walk this replaced: a directory's files come
+    before its subdirectories, which are visited depth-first in listing order,
+    so max_files truncation keeps the same files.
+    """
+    pending = [root]
+    while pending:
+        current = pending.pop()
+        subdirs = []
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith(_CODE_SUFFIXES) and entry.is_file():
+                        yield entry.path
+        except OSError as e:
+            logger.warning(f"Could not scan directory {current}: {e}")
+        # Reversed so the first listed subdirectory is popped next
+        pending.extend(reversed(subdirs))
+
+def _read_text(path: str) -> Optional[str]:
+    """Read a text file as UTF-8, ignoring undecodable bytes; None if unreadable
+
+    Files larger than MAX_FILE_BYTES (e.g. generated bundles) are truncated to
+    their first MAX_FILE_BYTES bytes instead of being decoded in full.
+    """
+    try:
+        if os.stat(path).st_size > MAX_FILE_BYTES:
+            logger.warning(f"Truncating {path} to first {MAX_FILE_BYTES} bytes")
+            with open(path, "rb") as f:
+                data = f.read(MAX_FILE_BYTES)
+            # Match text-mode universal newline handling
+            return data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except Exception as e:
+        logger.warning(f"Could not read file {path}: {e}")
+        return None
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_io_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by all local file reads for the server's lifetime"""
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="file-io")
+    return _io_executor
+
 class LocalFileReader:
     """Local file reader tool"""
 
     async def read_local_files(self, folder_path: str) -> List[CodeFile]:
         """Read JS/TS files from local folder"""
+        # The whole scan runs as one thread hop so the event loop is never blocked
+        # (run_in_executor rather than asyncio.to_thread, which needs Python 3.9)
+        return await asyncio.get_running_loop().run_in_executor(None, self._scan_sync, folder_path)
+
+    def _scan_sync(self, folder_path: str) -> List[CodeFile]:
+        """Scan and read JS/TS files synchronously"""
         folder = Path(folder_path)
         if not folder.exists() or not folder.is_dir():
             raise ValueError(f"Folder not found: {folder_path}")
 
+        root = str(folder)
+        paths = list(_iter_code_files(root))
+        # scandir paths are root-prefixed, so relative paths are a plain slice
+        root_prefix = root if root.endswith(os.sep) else root + os.sep
+
+        # Read files concurrently on the shared pool (file I/O releases the GIL);
+        # map() yields results in path order
+        contents = _get_io_executor().map(_read_text, paths)
+
         files: List[CodeFile] = []
-        for file_path in folder.rglob("*"):
-            if not file_path.is_file():
+        for file_path, content in zip(paths, contents):
+            if content is None:
                 continue
-            if file_path.suffix.lower() in {".js", ".ts"}:
-                try:
-                    content = file_path.read_text(encoding="utf-8", errors="ignore")
-                    rel_path = str(file_path.relative_to(folder).as_posix())
-                    files.append(CodeFile(
-                        path=rel_path,
-                        content=content,
-                        language="javascript" if file_path.suffix.lower() == ".js" else "typescript"
-                    ))
-                except Exception as e:
-                    logger.warning(f"Could not read file {file_path}: {e}")
+            if file_path.startswith(root_prefix):
+                rel_path = file_path[len(root_prefix):]
+            else:
+                rel_path = os.path.relpath(file_path, root)
+            if os.sep != "/":
+                rel_path = rel_path.replace(os.sep, "/")
+            files.append(CodeFile(
+                path=rel_path,
+                content=content,
+                language="javascript" if file_path.endswith(_JS_SUFFIXES) else "typescript"
+            ))
 
         return files
 
+@lru_cache(maxsize=8)
+def _load_prompt_files(prompts_dir: str, mtime_ns: int) -> Tuple[Tuple[str, str, str], ...]:
+    """Read prompt templates as (name, content, file) tuples
+
+    Cached per (directory, mtime_ns), so a directory is parsed again only after
+    one of its templates (or the directory listing) changes.
+    """
+    prompts = []
+    for prompt_file in sorted(Path(prompts_dir).glob("*.txt")):
+        try:
+            content = prompt_file.read_text(encoding="utf-8")
+            prompts.append((prompt_file.stem, content, str(prompt_file)))
+        except Exception as e:
+            logger.warning(f"Could not read prompt file {prompt_file}: {e}")
+    return tuple(prompts)
+
+def _prompts_mtime_ns(prompts_dir: str) -> int:
+    """Latest modification time of the directory and its *.txt templates"""
+    latest = os.stat(prompts_dir).st_mtime_ns
+    with os.scandir(prompts_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".txt"):
+                latest = max(latest, entry.stat().st_mtime_ns)
+    return latest
+
 class PromptLoader:
     """Prompt template loader"""
 
     def __init__(self, prompts_dir: str = None):
         if prompts_dir is None:
             # Default to prompts directory relative to this script
-            script_dir = Path(__file__).resolve().parent
-            prompts_dir = script_dir / "prompts"
+            prompts_dir = PROMPTS_DIR
 
         self.prompts_dir = Path(prompts_dir)
-        self._prompts: Optional[List[Dict[str, str]]] = None
         logger.info(f"[PromptLoader] Using prompts dir: {self.prompts_dir}")
 
     async def load_prompts(self) -> List[Dict[str, str]]:
-        """Load all prompt templates"""
-        if self._prompts is not None:
-            return self._prompts
-
+        """Load all prompt templates (parsed once per directory change, shared across loaders)"""
         if not self.prompts_dir.exists():
             raise FileNotFoundError(f"Prompts directory not found: {self.prompts_dir}")
 
-        prompts: List[Dict[str, str]] = []
-        for prompt_file in sorted(self.prompts_dir.glob("*.txt")):
-            try:
-                content = prompt_file.read_text(encoding="utf-8")
-                prompts.append({
-                    "name": prompt_file.stem,
-                    "content": content,
-                    "file": str(prompt_file)
-                })
-            except Exception as e:
-                logger.warning(f"Could not read prompt file {prompt_file}: {e}")
+        prompts_dir = str(self.prompts_dir)
+        return [
+            {"name": name, "content": content, "file": file}
+            for name, content, file in _load_prompt_files(prompts_dir, _prompts_mtime_ns(prompts_dir))
+        ]
 
-        self._prompts = prompts
-        return prompts
+# SDK-level retries (exponential backoff) for 429/5xx/connection errors
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+
+# Model families known to accept response_format={"type": "json_object"}
+_JSON_MODE_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-4-turbo", "gpt-3.5-turbo", "gpt-5")
+
+_openai_client: Optional["AsyncOpenAI"] = None
+
+def get_openai_client() -> "AsyncOpenAI":
+    """Process-wide AsyncOpenAI client multiplexing requests over HTTP/2 when available"""
+    global _openai_client
+    if _openai_client is None:
+        from openai import AsyncOpenAI
+
+        limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        try:
+            http_client = httpx.AsyncClient(http2=True, limits=limits, timeout=60.0)
+        except ImportError:
+            # h2 not installed (pip install "httpx[http2]"); fall back to HTTP/1.1 pooling
+            http_client = httpx.AsyncClient(limits=limits, timeout=60.0)
+        _openai_client = AsyncOpenAI(http_client=http_client, max_retries=OPENAI_MAX_RETRIES)
+    return _openai_client
+
+async def _read_completion(response: Any) -> str:
+    """Collect the text of a streamed chat completion
+
+    Deltas are gathered as they arrive and joined once at the end. A complete
+    (non-stream) response object is also accepted, for SDKs that ignore stream.
+    """
+    if not hasattr(response, "__aiter__"):
+        return response.choices[0].message.content or "{}"
+    parts: List[str] = []
+    async for chunk in response:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+    return "".join(parts) or "{}"
+
+def _is_response_format_error(error: Exception) -> bool:
+    """Whether an OpenAI 400 rejected the response_format parameter"""
+    return getattr(error, "param", None) == "response_format" or "response_format" in str(error)
 
 class SecurityAnalyzer:
     """AI-powered security analyzer"""
 
+    # model -> whether JSON mode is supported, learned from the first request
+    # for models outside _JSON_MODE_MODEL_PREFIXES
+    _json_mode_support: Dict[str, bool] = {}
+
     def __init__(self, model: str = None):
         self.model = model or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-        self.openai_client = OpenAI()
+        self._openai_client: Optional["AsyncOpenAI"] = None
+        # None until probed by the first request
+        self._use_json_mode: Optional[bool] = (
+            True if self.model.startswith(_JSON_MODE_MODEL_PREFIXES)
+            else self._json_mode_support.get(self.model)
+        )
+        # Caps in-flight OpenAI requests across concurrent analyses
+        self._semaphore = asyncio.Semaphore(int(os.getenv("OPENAI_CONCURRENCY", "10")))
+        # (model, template digest, content digest) -> result, least recently used first
+        self._cache: "OrderedDict[Tuple[str, bytes, bytes], SecurityAnalysisResult]" = OrderedDict()
+
+    @property
+    def openai_client(self) -> "AsyncOpenAI":
+        """Shared OpenAI client, created on first use"""
+        if self._openai_client is None:
+            self._openai_client = get_openai_client()
+        return self._openai_client
 
     async def analyze_code(self, code_file: CodeFile, prompt_template: str) -> SecurityAnalysisResult:
-        """Analyze code for security vulnerabilities using AI"""
-
-        # Fill prompt placeholders
-        filled_prompt = prompt_template.replace("{CODE HERE}", code_file.content)
-        filled_prompt = filled_prompt.replace("{}", code_file.content)
-        filled_prompt = filled_prompt.replace("/index.js", code_file.path)
-
-        try:
-            response = self.openai_client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": filled_prompt},
-                ],
-                temperature=0.2,
-                response_format={"type": "json_object"},
-                timeout=60,
-            )
-            content = response.choices[0].message.content or "{}"
-        except Exception:
-            # Fallback without response_format
-            response = self.openai_client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": filled_prompt},
-                ],
-                temperature=0.2,
-                timeout=60,
-            )
-            content = response.choices[0].message.content or "{}"
+        """Analyze code for security vulnerabilities using AI
+
+        Results are cached by model, template and file content, so re-running the
+        same analysis (e.g. an unchanged file in a later batch) skips the API call.
+        """
+        key = (
+            self.model,
+            hashlib.blake2b(prompt_template.encode("utf-8"), digest_size=16).digest(),
+            hashlib.blake2b(code_file.content.encode("utf-8"), digest_size=16).digest(),
+        )
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return replace(cached, file_path=code_file.path, findings=list(cached.findings))
+
+        result = await self._analyze_uncached(code_file, prompt_template)
+        if ANALYSIS_CACHE_SIZE > 0:
+            self._cache[key] = result
+            if len(self._cache) > ANALYSIS_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        """Send one chat completion, in JSON mode when the model supports it
+
+        Transient failures are retried by the client (OPENAI_MAX_RETRIES); only a
+        400 rejecting response_format falls back to a plain request, and the
+        outcome is remembered per model so later calls skip the probe.
+        """
+        from openai import BadRequestError
+
+        kwargs: Dict[str, Any] = {
+            "model": self.model, "messages": messages, "temperature": 0.2, "timeout": 60, "stream": True,
+        }
+        # The API rejects JSON mode unless the messages mention JSON, which the
+        # bundled fix-only templates do not; skip the guaranteed 400 round-trip
+        wants_json = any("json" in m["content"].lower() for m in messages)
+        if wants_json and self._use_json_mode is not False:
+            try:
+                response = await self.openai_client.chat.completions.create(
+                    response_format={"type": "json_object"}, **kwargs
+                )
+                if self._use_json_mode is None:
+                    self._use_json_mode = self._json_mode_support[self.model] = True
+                return await _read_completion(response)
+            except BadRequestError as e:
+                # Other 400s (e.g. context length) say nothing about JSON mode support
+                if self._use_json_mode or not _is_response_format_error(e):
+                    raise
+                logger.info(f"Model {self.model} rejected JSON mode; sending plain requests")
+                self._use_json_mode = self._json_mode_support[self.model] = False
+
+        response = await self.openai_client.chat.completions.create(**kwargs)
+        return await _read_completion(response)
+
+    async def _analyze_uncached(self, code_file: CodeFile, prompt_template: str) -> SecurityAnalysisResult:
+        """Run one analysis through the OpenAI API"""
+
+        # Fill prompt placeholders; the code itself is sent once in the system message
+        filled_prompt = fill_prompt_placeholders(prompt_template, code_file.path)
+
+        # File content first so every prompt for the same file shares an identical
+        # prefix (eligible for OpenAI prompt caching); the template follows
+        messages = [
+            {"role": "system", "content": f"Analyze this file {code_file.path}:\n\n{code_file.content}"},
+            {"role": "user", "content": filled_prompt},
+        ]
+
+        async with self._semaphore:
+            content = await self._complete(messages)
 
         # Parse response
         try:
-            result_data = json.loads(content)
+            result_data = _loads_json(content)
         except json.JSONDecodeError:
             # Try to extract JSON from response
-            json_match = re.search(r"(\{[\s\S]*\})", content)
+            json_match = _FIRST_OBJ_RE.search(content)
             if json_match:
                 try:
-                    result_data = json.loads(json_match.group(1))
+                    result_data = _loads_json(json_match.group(1))
                 except json.JSONDecodeError:
                     result_data = {}
             else:
@@ -259,19 +889,25 @@ class SecurityAnalyzer:
         # Extract code blocks if no structured response
         fixed_code = result_data.get("fixed_code", "")
         if not fixed_code and content:
-            code_blocks = re.findall(r"```(?:javascript|js|typescript|ts)?\s*([\s\S]*?)```", content)
-            if code_blocks:
-                fixed_code = code_blocks[0].strip()
+            # Only the first block is used, so stop scanning once it is found
+            code_block = _CODE_BLOCK_RE.search(content)
+            if code_block:
+                fixed_code = code_block.group(1).strip()
             else:
                 fixed_code = content.strip()
 
+        # The model may send null or a bare string; cache hits copy this as a list
+        findings = result_data.get("findings")
+        if not isinstance(findings, list):
+            findings = [findings] if isinstance(findings, str) and findings else []
+
         return SecurityAnalysisResult(
             file_path=code_file.path,
             vulnerability_type=result_data.get("vulnerability_type", "Unknown"),
             severity=result_data.get("severity", "Medium"),
             description=result_data.get("summary", ""),
             fixed_code=fixed_code,
-            findings=result_data.get("findings", []),
+            findings=findings,
             prompt_used=prompt_template[:100] + "..." if len(prompt_template) > 100 else prompt_template
         )
 
@@ -280,7 +916,13 @@ class SecurityMCPServer:
 
     def __init__(self):
         self.server = Server("security-analyzer")
-        self.github_fetcher = GitHubFetcher()
+        # One pooled client for the server's lifetime keeps GitHub connections
+        # (TLS sessions, keep-alive) warm across tool calls; closed in run()
+        self._http = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=8),
+        )
+        self.github_fetcher = GitHubFetcher(client=self._http)
         self.local_reader = LocalFileReader()
         self.prompt_loader = PromptLoader()
         self.security_analyzer = SecurityAnalyzer()
@@ -304,7 +946,10 @@ class SecurityMCPServer:
                             "owner": {"type": "string", "description": "GitHub repository owner"},
                             "repo": {"type": "string", "description": "GitHub repository name"},
                             "branch": {"type": "string", "description": "Branch name (default: main)"},
-                            "folder": {"type": "string", "description": "Folder path to filter files (optional)"}
+                            "folder": {"type": "string", "description": "Folder path to filter files (optional)"},
+                            "use_tarball": {"type": "boolean", "description": "Download the branch as one tarball instead of per-file requests", "default": False},
+                            "max_file_bytes": {"type": "integer", "description": "Skip files larger than this many bytes (0 for no limit)", "default": GITHUB_MAX_FILE_BYTES},
+                            "skip_vendor": {"type": "boolean", "description": "Skip minified files and node_modules/dist/build directories", "default": True}
                         },
                         "required": ["owner", "repo"]
                     }
@@ -357,7 +1002,10 @@ class SecurityMCPServer:
                                     "owner": {"type": "string"},
                                     "repo": {"type": "string"},
                                     "branch": {"type": "string"},
-                                    "folder": {"type": "string"}
+                                    "folder": {"type": "string"},
+                                    "use_tarball": {"type": "boolean"},
+                                    "max_file_bytes": {"type": "integer"},
+                                    "skip_vendor": {"type": "boolean"}
                                 }
                             },
                             "local_path": {"type": "string", "description": "Local folder path"},
@@ -376,22 +1024,27 @@ class SecurityMCPServer:
                     repo = arguments["repo"]
                     branch = arguments.get("branch", "main")
                     folder = arguments.get("folder", "")
+                    use_tarball = arguments.get("use_tarball", False)
+                    max_file_bytes = arguments.get("max_file_bytes")
+                    skip_vendor = arguments.get("skip_vendor", True)
 
-                    files = await self.github_fetcher.fetch_repo_files(owner, repo, branch, folder)
+                    files = await self.github_fetcher.fetch_repo_files(
+                        owner, repo, branch, folder, use_tarball, max_file_bytes, skip_vendor
+                    )
                     result = {
                         "files_found": len(files),
-                        "files": [asdict(f) for f in files]
+                        "files": [_codefile_to_dict(f) for f in files]
                     }
-                    return [TextContent(type="text", text=json.dumps(result, indent=2))]
+                    return [TextContent(type="text", text=_dumps_json(result, indent=False))]
 
                 elif name == "read_local_files":
                     folder_path = arguments["folder_path"]
                     files = await self.local_reader.read_local_files(folder_path)
                     result = {
                         "files_found": len(files),
-                        "files": [asdict(f) for f in files]
+                        "files": [_codefile_to_dict(f) for f in files]
                     }
-                    return [TextContent(type="text", text=json.dumps(result, indent=2))]
+                    return [TextContent(type="text", text=_dumps_json(result, indent=False))]
 
                 elif name == "load_prompts":
                     prompts_dir = arguments.get("prompts_dir")
@@ -403,7 +1056,7 @@ class SecurityMCPServer:
                         "prompts_loaded": len(prompts),
                         "prompts": prompts
                     }
-                    return [TextContent(type="text", text=json.dumps(result, indent=2))]
+                    return [TextContent(type="text", text=_dumps_json(result))]
 
                 elif name == "analyze_security":
                     file_path = arguments["file_path"]
@@ -427,7 +1080,7 @@ class SecurityMCPServer:
 
                     # Analyze
                     result = await self.security_analyzer.analyze_code(code_file, prompt_template)
-                    return [TextContent(type="text", text=json.dumps(asdict(result), indent=2))]
+                    return [TextContent(type="text", text=_dumps_json(_result_to_dict(result)))]
 
                 elif name == "batch_analyze":
                     source_type = arguments["source_type"]
@@ -440,7 +1093,10 @@ class SecurityMCPServer:
                             github_params["owner"],
                             github_params["repo"],
                             github_params.get("branch", "main"),
-                            github_params.get("folder", "")
+                            github_params.get("folder", ""),
+                            github_params.get("use_tarball", False),
+                            github_params.get("max_file_bytes"),
+                            github_params.get("skip_vendor", True)
                         )
                     else:  # local
                         local_path = arguments["local_path"]
@@ -449,28 +1105,59 @@ class SecurityMCPServer:
                     # Load prompts
                     prompts = await self.prompt_loader.load_prompts()
 
-                    # Analyze files
-                    results = []
-                    for i, code_file in enumerate(files[:max_files]):
-                        file_results = []
-                        for prompt in prompts:
-                            try:
-                                analysis = await self.security_analyzer.analyze_code(
-                                    code_file, prompt["content"]
-                                )
-                                file_results.append(asdict(analysis))
-                            except Exception as e:
-                                file_results.append({
-                                    "error": str(e),
-                                    "prompt_name": prompt["name"]
-                                })
-
-                        results.append({
-                            "file_path": code_file.path,
-                            "analyses": file_results
-                        })
-
-                    return [TextContent(type="text", text=json.dumps(results, indent=2))]
+                    async def analyze_with_prompt(code_file: CodeFile, prompt: Dict[str, str]) -> Dict[str, Any]:
+                        try:
+                            analysis = await self.security_analyzer.analyze_code(
+                                code_file, prompt["content"]
+                            )
+                            return _result_to_dict(analysis)
+                        except Exception as e:
+                            return {
+                                "error": str(e),
+                                "prompt_name": prompt["name"]
+                            }
+
+                    # Files with identical content are analyzed once and reuse the results
+                    selected = files[:max_files]
+                    unique_files: Dict[bytes, CodeFile] = {}
+                    digests = []
+                    for code_file in selected:
+                        digest = hashlib.blake2b(code_file.content.encode("utf-8"), digest_size=16).digest()
+                        unique_files.setdefault(digest, code_file)
+                        digests.append(digest)
+
+                    # Every (file, prompt) pair runs concurrently; the analyzer's
+                    # semaphore (OPENAI_CONCURRENCY) bounds in-flight requests
+                    flat = await asyncio.gather(*[
+                        analyze_with_prompt(code_file, prompt)
+                        for code_file in unique_files.values()
+                        for prompt in prompts
+                    ])
+                    per_digest = {
+                        digest: list(flat[i * len(prompts):(i + 1) * len(prompts)])
+                        for i, digest in enumerate(unique_files)
+                    }
+
+                    def file_entries():
+                        for code_file, digest in zip(selected, digests):
+                            file_results = per_digest[digest]
+                            if unique_files[digest] is not code_file:
+                                file_results = [
+                                    {**analysis, "file_path": code_file.path} if "file_path" in analysis else dict(analysis)
+                                    for analysis in file_results
+                                ]
+                            yield {
+                                "file_path": code_file.path,
+                                "analyses": file_results
+                            }
+
+                    # One compact TextContent per file rather than a single large
+                    # document holding every file's analyses
+                    contents = [
+                        TextContent(type="text", text=_dumps_json(entry, indent=False))
+                        for entry in file_entries()
+                    ]
+                    return contents or [TextContent(type="text", text="[]")]
 
                 else:
                     return [TextContent(type="text", text=f"Unknown tool: {name}")]
@@ -503,7 +1190,7 @@ class SecurityMCPServer:
         async def read_resource(uri: str) -> str:
             if uri == "prompts://templates":
                 prompts = await self.prompt_loader.load_prompts()
-                return json.dumps(prompts, indent=2)
+                return _dumps_json(prompts)
             elif uri == "config://server":
                 config = {
                     "server_name": "security-analyzer",
@@ -519,51 +1206,54 @@ class SecurityMCPServer:
                     "openai_configured": bool(os.getenv("OPENAI_API_KEY")),
                     "openai_model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
                 }
-                return json.dumps(config, indent=2)
+                return _dumps_json(config)
             else:
                 raise ValueError(f"Unknown resource: {uri}")
 
     async def run(self):
         """Run the MCP server"""
-        async with stdio_server() as (read_stream, write_stream):
-            # Build capabilities with compatibility across SDK versions
-            try:
-                if NotificationOptions is not None:
-                    capabilities = self.server.get_capabilities(
-                        notification_options=NotificationOptions(),
-                        experimental_capabilities={}
-                    )
-                else:
+        try:
+            async with stdio_server() as (read_stream, write_stream):
+                # Build capabilities with compatibility across SDK versions
+                try:
+                    if NotificationOptions is not None:
+                        capabilities = self.server.get_capabilities(
+                            notification_options=NotificationOptions(),
+                            experimental_capabilities={}
+                        )
+                    else:
+                        capabilities = self.server.get_capabilities()  # type: ignore
+                except TypeError:
                     capabilities = self.server.get_capabilities()  # type: ignore
-            except TypeError:
-                capabilities = self.server.get_capabilities()  # type: ignore
 
-            # Initialization options (if supported by SDK)
-            init_opts = None
-            if InitializationOptions:
+                # Initialization options (if supported by SDK)
+                init_opts = None
+                if InitializationOptions:
+                    try:
+                        init_opts = InitializationOptions(
+                            client_name="security-analyzer-client",
+                            client_version="1.0.0"
+                        )
+                    except Exception:
+                        init_opts = None  # older SDKs
+
+                # Newer SDKs: run(read, write, capabilities=..., initialization_options=?)
+                # Older SDKs: run(read, write, capabilities=...)
                 try:
-                    init_opts = InitializationOptions(
-                        client_name="security-analyzer-client",
-                        client_version="1.0.0"
+                    await self.server.run(
+                        read_stream,
+                        write_stream,
+                        capabilities=capabilities,
+                        initialization_options=init_opts,  # type: ignore[call-arg]
                     )
-                except Exception:
-                    init_opts = None  # older SDKs
-
-            # Newer SDKs: run(read, write, capabilities=..., initialization_options=?)
-            # Older SDKs: run(read, write, capabilities=...)
-            try:
-                await self.server.run(
-                    read_stream,
-                    write_stream,
-                    capabilities=capabilities,
-                    initialization_options=init_opts,  # type: ignore[call-arg]
-                )
-            except TypeError:
-                await self.server.run(
-                    read_stream,
-                    write_stream,
-                    capabilities=capabilities,
-                )
+                except TypeError:
+                    await self.server.run(
+                        read_stream,
+                        write_stream,
+                        capabilities=capabilities,
+                    )
+        finally:
+            await self._http.aclose()
 
 def validate_environment():
     """Validate required environment variables"""
@@ -600,4 +1290,4 @@ async def main():
         raise
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_with_uvloop(main())
@@ -3,13 +3,13 @@
 Simple runner script for MCP Security Analysis Server
 """
 
-import asyncio
 import sys
 from pathlib import Path
 
 # Add current directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
+from _runtime import run_with_uvloop
 from mcp_server import main
 
 if __name__ == "__main__":
@@ -19,7 +19,7 @@ if __name__ == "__main__":
     print("🔧 Press Ctrl+C to stop the server\n")
     
     try:
-        asyncio.run(main())
+        run_with_uvloop(main())
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")
     except Exception as e:
@@ -3,80 +3,90 @@
 Basic MCP functionality tests
 """
 
+import importlib.util
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List, Tuple
 
-sys.path.insert(0, str(Path(__file__).parent))
+MODULE_DIR = Path(__file__).resolve().parent
+PROMPTS_DIR = MODULE_DIR / "prompts"
 
-def test_imports():
-    """Test if all required modules can be imported"""
-    print("🧪 Testing imports...")
+sys.path.insert(0, str(MODULE_DIR))
+
+def test_imports() -> Tuple[bool, List[str]]:
+    """Test if all required modules can be imported; returns (passed, report lines)"""
+    lines: List[str] = []
+    lines.append("🧪 Testing imports...")
     
     try:
         import mcp
-        print("✅ MCP package imported successfully")
+        lines.append("✅ MCP package imported successfully")
     except ImportError as e:
-        print(f"❌ MCP package import failed: {e}")
-        return False
+        lines.append(f"❌ MCP package import failed: {e}")
+        return False, lines
     
     try:
         from mcp.server import Server
         from mcp.server.stdio import stdio_server
-        print("✅ MCP server modules imported successfully")
+        lines.append("✅ MCP server modules imported successfully")
     except ImportError as e:
-        print(f"❌ MCP server modules import failed: {e}")
-        return False
+        lines.append(f"❌ MCP server modules import failed: {e}")
+        return False, lines
     
     try:
         from mcp import ClientSession, StdioServerParameters
         from mcp import stdio_client
-        print("✅ MCP client modules imported successfully")
+        lines.append("✅ MCP client modules imported successfully")
     except ImportError as e:
-        print(f"❌ MCP client modules import failed: {e}")
-        return False
+        lines.append(f"❌ MCP client modules import failed: {e}")
+        return False, lines
     
-    try:
-        from dotenv import load_dotenv
-        print("✅ dotenv imported successfully")
-    except ImportError as e:
-        print(f"❌ dotenv import failed: {e}")
-        return False
+    # Only availability matters here, so locate the packages without paying
+    # for their import
+    if importlib.util.find_spec("dotenv") is not None:
+        lines.append("✅ dotenv is installed")
+    else:
+        lines.append("❌ dotenv import failed: No module named 'dotenv'")
+        return False, lines
     
-    try:
-        from openai import OpenAI
-        print("✅ OpenAI imported successfully")
-    except ImportError as e:
-        print(f"❌ OpenAI import failed: {e}")
-        return False
+    if importlib.util.find_spec("openai") is not None:
+        lines.append("✅ OpenAI is installed")
+    else:
+        lines.append("❌ OpenAI import failed: No module named 'openai'")
+        return False, lines
     
-    return True
+    return True, lines
 
-def test_server_creation():
-    """Test if MCP server can be created"""
-    print("\n🏗️ Testing server creation...")
+def test_server_creation() -> Tuple[bool, List[str]]:
+    """Test if MCP server can be created; returns (passed, report lines)"""
+    lines: List[str] = []
+    lines.append("\n🏗️ Testing server creation...")
     
     try:
         from mcp.server import Server
         from mcp.server.models import InitializationOptions
         
         server = Server("security-analyzer")
-        print("✅ MCP server created successfully")
+        lines.append("✅ MCP server created successfully")
         
         # Test capabilities
         capabilities = server.get_capabilities(
             notification_options=None,
             experimental_capabilities={}
         )
-        print("✅ Server capabilities retrieved successfully")
+        lines.append("✅ Server capabilities retrieved successfully")
         
-        return True
+        return True, lines
     except Exception as e:
-        print(f"❌ Server creation failed: {e}")
-        return False
+        lines.append(f"❌ Server creation failed: {e}")
+        return False, lines
 
-def test_tool_registration():
-    """Test if tools can be registered"""
-    print("\n🔧 Testing tool registration...")
+def test_tool_registration() -> Tuple[bool, List[str]]:
+    """Test if tools can be registered; returns (passed, report lines)"""
+    lines: List[str] = []
+    lines.append("\n🔧 Testing tool registration...")
     
     try:
         from mcp.server import Server
@@ -95,30 +105,44 @@ def test_tool_registration():
                 )
             ]
         
-        print("✅ Tool registration successful")
-        return True
+        lines.append("✅ Tool registration successful")
+        return True, lines
     except Exception as e:
-        print(f"❌ Tool registration failed: {e}")
-        return False
+        lines.append(f"❌ Tool registration failed: {e}")
+        return False, lines
 
-def test_prompt_loading():
-    """Test if prompts can be loaded"""
-    print("\n📝 Testing prompt loading...")
+def test_prompt_loading() -> Tuple[bool, List[str]]:
+    """Test if prompts can be loaded; returns (passed, report lines)"""
+    lines: List[str] = []
+    lines.append("\n📝 Testing prompt loading...")
     
     try:
-        prompts_dir = Path(__file__).parent / "prompts"
+        prompts_dir = PROMPTS_DIR
         if prompts_dir.exists():
-            prompt_files = list(prompts_dir.glob("*.txt"))
-            print(f"✅ Found {len(prompt_files)} prompt files:")
-            for prompt_file in prompt_files:
-                print(f"  - {prompt_file.name}")
-            return True
+            # Single scandir pass: name and size come from the directory entry
+            with os.scandir(prompts_dir) as entries:
+                prompt_files = sorted(
+                    (entry.name, entry.stat().st_size)
+                    for entry in entries
+                    if entry.name.endswith(".txt") and entry.is_file(follow_symlinks=False)
+                )
+            lines.append(f"✅ Found {len(prompt_files)} prompt files:")
+            for name, size in prompt_files:
+                lines.append(f"  - {name} ({size:,} bytes)")
+            return True, lines
         else:
-            print(f"❌ Prompts directory not found: {prompts_dir}")
-            return False
+            lines.append(f"❌ Prompts directory not found: {prompts_dir}")
+            return False, lines
+    except Exception as e:
+        lines.append(f"❌ Prompt loading failed: {e}")
+        return False, lines
+
+def run_test(test) -> Tuple[bool, List[str]]:
+    """Run one test, turning an unexpected exception into a failed result"""
+    try:
+        return test()
     except Exception as e:
-        print(f"❌ Prompt loading failed: {e}")
-        return False
+        return False, [f"❌ Test {test.__name__} failed with exception: {e}"]
 
 def main():
     """Main test function"""
@@ -131,15 +155,17 @@ def main():
         test_prompt_loading
     ]
     
-    passed = 0
     total = len(tests)
     
-    for test in tests:
-        try:
-            if test():
-                passed += 1
-        except Exception as e:
-            print(f"❌ Test {test.__name__} failed with exception: {e}")
+    # Tests are independent, so run them concurrently; each returns its report
+    # lines, printed afterwards in the original order
+    with ThreadPoolExecutor(max_workers=total) as executor:
+        results = list(executor.map(run_test, tests))
+    
+    passed = 0
+    for test_passed, lines in results:
+        print("\n".join(lines))
+        passed += test_passed
     
     print(f"\n📊 Test Results: {passed}/{total} tests passed")
     
@@ -5,153 +5,207 @@ Test script for MCP Security Analysis Server
 
 import asyncio
 import json
+import logging
 import os
 import sys
+import time
+from itertools import islice
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 # Add current directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
+from _runtime import run_with_uvloop
 from mcp_client import SecurityMCPClient, SecurityAnalysisWorkflow
 
-async def test_mcp_server():
-    """Test the MCP server functionality"""
-    print("🧪 Testing MCP Security Analysis Server\n")
-    
-    # Check environment variables
-    if not os.getenv("OPENAI_API_KEY"):
-        print("❌ OPENAI_API_KEY not set. Please set it in your environment or .env file.")
+logger = logging.getLogger(__name__)
+
+SAMPLES_DIR = Path(__file__).parent / "samples"
+
+# Environment variables that must be set (non-empty) before any test runs
+REQUIRED_ENV = ("OPENAI_API_KEY",)
+
+# Sample files analyzed in the analysis test
+MAX_SAMPLE_ANALYSES = 3
+
+# Analyses in flight at once across both suites, which share one stdio pipe
+MAX_CONCURRENCY = int(os.getenv("MCP_MAX_CONCURRENCY", "8"))
+
+def check_environment():
+    """Check required environment variables before starting any test"""
+    missing = [name for name in REQUIRED_ENV if not os.environ.get(name)]
+    if missing:
+        print(f"❌ {', '.join(missing)} not set. Please set it in your environment or .env file.")
         return False
     
     print("✅ Environment variables check passed")
-    
-    client = SecurityMCPClient()
+    return True
+
+async def load_samples(client: SecurityMCPClient) -> Optional[Dict[str, Any]]:
+    """Read the samples directory once for both suites; None if it does not exist"""
+    # stat() off the event loop (run_in_executor: asyncio.to_thread needs 3.9)
+    if not await asyncio.get_running_loop().run_in_executor(None, SAMPLES_DIR.exists):
+        return None
+    return await client.read_local_files(str(SAMPLES_DIR))
+
+async def test_mcp_server(client: SecurityMCPClient, files_result: Optional[Dict[str, Any]]) -> Tuple[bool, List[str]]:
+    """Test the MCP server functionality over an already connected client
+
+    Returns (passed, report lines); the report is collected rather than printed
+    so it does not interleave with the concurrently running workflow test.
+    """
+    lines: List[str] = []
+    lines.append("🧪 Testing MCP Security Analysis Server\n")
     
     try:
-        # Connect to server
-        print("🔌 Connecting to MCP server...")
-        await client.connect()
-        print("✅ Connected successfully")
+        tools, prompts_result = await asyncio.gather(client.list_tools(), client.load_prompts())
         
         # Test 1: List tools
-        print("\n📋 Testing tool listing...")
-        tools = await client.list_tools()
-        print(f"✅ Found {len(tools)} tools:")
+        lines.append("\n📋 Testing tool listing...")
+        lines.append(f"✅ Found {len(tools)} tools:")
         for tool in tools:
-            print(f"  - {tool['name']}: {tool['description']}")
+            lines.append(f"  - {tool['name']}: {tool['description']}")
         
         # Test 2: Load prompts
-        print("\n📝 Testing prompt loading...")
-        prompts_result = await client.load_prompts()
-        print(f"✅ Loaded {prompts_result['prompts_loaded']} prompts:")
+        lines.append("\n📝 Testing prompt loading...")
+        lines.append(f"✅ Loaded {prompts_result['prompts_loaded']} prompts:")
         for prompt in prompts_result['prompts']:
-            print(f"  - {prompt['name']}")
+            lines.append(f"  - {prompt['name']}")
         
-        # Test 3: Read local files (if samples exist)
-        samples_dir = Path(__file__).parent / "samples"
-        if samples_dir.exists():
-            print(f"\n📁 Testing local file reading from {samples_dir}...")
-            files_result = await client.read_local_files(str(samples_dir))
-            print(f"✅ Found {files_result['files_found']} files:")
-            for file_info in files_result['files'][:3]:  # Show first 3
-                print(f"  - {file_info['path']} ({file_info['language']})")
+        # Test 3: Read local files (if samples exist; read once in main())
+        samples_exist = files_result is not None
+        if samples_exist:
+            lines.append(f"\n📁 Testing local file reading from {SAMPLES_DIR}...")
+            lines.append(f"✅ Found {files_result['files_found']} files:")
+            for file_info in islice(files_result['files'], 3):  # Show first 3
+                lines.append(f"  - {file_info['path']} ({file_info['language']})")
         
-        # Test 4: Single file analysis (if we have files and prompts)
-        if samples_dir.exists() and prompts_result['prompts']:
-            print(f"\n🔍 Testing single file analysis...")
-            sample_files = files_result['files']
+        # Test 4: Sample file analysis (if we have files and prompts)
+        if samples_exist and prompts_result['prompts']:
+            lines.append(f"\n🔍 Testing sample file analysis...")
+            sample_files = files_result['files'][:MAX_SAMPLE_ANALYSES]
             if sample_files:
-                sample_file = sample_files[0]
                 prompt_name = prompts_result['prompts'][0]['name']
+                lines.append(f"  Analyzing {len(sample_files)} files concurrently")
+                lines.append(f"  Using prompt: {prompt_name}")
                 
-                print(f"  Analyzing: {sample_file['path']}")
-                print(f"  Using prompt: {prompt_name}")
-                
-                analysis = await client.analyze_security(
-                    sample_file['path'],
-                    sample_file['content'],
-                    sample_file['language'],
-                    prompt_name
-                )
-                
-                print(f"✅ Analysis complete:")
-                print(f"  - Vulnerability type: {analysis.get('vulnerability_type', 'Unknown')}")
-                print(f"  - Severity: {analysis.get('severity', 'Unknown')}")
-                print(f"  - Findings: {len(analysis.get('findings', []))}")
-                print(f"  - Fixed code length: {len(analysis.get('fixed_code', ''))}")
+                # Results are recorded as each analysis finishes
+                started = time.perf_counter()
+                async for sample_file, analysis in client.analyze_security_stream(
+                    sample_files, prompt_name, max_concurrency=MAX_CONCURRENCY
+                ):
+                    lines.append(f"  {sample_file['path']} ({time.perf_counter() - started:.2f}s):")
+                    lines.append(f"  - Vulnerability type: {analysis.get('vulnerability_type', 'Unknown')}")
+                    lines.append(f"  - Severity: {analysis.get('severity', 'Unknown')}")
+                    lines.append(f"  - Findings: {len(analysis.get('findings', []))}")
+                    lines.append(f"  - Fixed code length: {len(analysis.get('fixed_code', ''))}")
+                elapsed = time.perf_counter() - started
+                lines.append(f"✅ Analysis complete in {elapsed:.2f}s")
         
-        print("\n🎉 All tests passed!")
-        return True
+        lines.append("\n🎉 All tests passed!")
+        return True, lines
         
     except Exception as e:
-        print(f"\n❌ Test failed: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-    
-    finally:
-        await client.disconnect()
-        print("🔌 Disconnected from server")
+        lines.append(f"\n❌ Test failed: {e}")
+        logger.exception("test_mcp_server failed")
+        return False, lines
 
-async def test_workflow():
-    """Test the high-level workflow"""
-    print("\n🔄 Testing Security Analysis Workflow\n")
+async def test_workflow(client: SecurityMCPClient, files_result: Optional[Dict[str, Any]]) -> Tuple[bool, List[str]]:
+    """Test the high-level workflow over an already connected client; returns (passed, report lines)"""
+    lines: List[str] = []
+    lines.append("\n🔄 Testing Security Analysis Workflow\n")
     
-    client = SecurityMCPClient()
     workflow = SecurityAnalysisWorkflow(client)
     
     try:
-        await client.connect()
-        
         # Test local folder analysis
-        samples_dir = Path(__file__).parent / "samples"
-        if samples_dir.exists():
-            print(f"📁 Testing workflow with local folder: {samples_dir}")
-            results = await workflow.analyze_local_folder(str(samples_dir), max_files=2)
+        if files_result is not None:
+            lines.append(f"📁 Testing workflow with local folder: {SAMPLES_DIR}")
+            results = await workflow.analyze_local_folder(
+                str(SAMPLES_DIR), max_files=2, files_result=files_result
+            )
             
-            print(f"✅ Workflow completed:")
-            print(f"  - Files analyzed: {results['files_analyzed']}")
-            print(f"  - Prompts used: {results['prompts_used']}")
+            lines.append(f"✅ Workflow completed:")
+            lines.append(f"  - Files analyzed: {results['files_analyzed']}")
+            lines.append(f"  - Prompts used: {results['prompts_used']}")
             
             # Save results
             output_file = "test_workflow_results.json"
             await workflow.save_results(results, output_file)
-            print(f"  - Results saved to: {output_file}")
+            lines.append(f"  - Results saved to: {output_file}")
         
-        print("\n🎉 Workflow test passed!")
-        return True
+        lines.append("\n🎉 Workflow test passed!")
+        return True, lines
         
     except Exception as e:
-        print(f"\n❌ Workflow test failed: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-    
-    finally:
-        await client.disconnect()
+        lines.append(f"\n❌ Workflow test failed: {e}")
+        logger.exception("test_workflow failed")
+        return False, lines
 
 async def main():
     """Main test function"""
     print("🚀 MCP Security Analysis Server Test Suite\n")
     
-    # Test basic functionality
-    basic_test_passed = await test_mcp_server()
+    if not check_environment():
+        print("\n💥 Basic tests failed. Please check your setup.")
+        return 1
     
-    if basic_test_passed:
-        # Test workflow
-        workflow_test_passed = await test_workflow()
-        
-        if workflow_test_passed:
-            print("\n🎊 All tests passed! MCP server is working correctly.")
-            return 0
-        else:
-            print("\n⚠️ Basic tests passed but workflow test failed.")
+    # One connection (server spawn + initialize handshake) shared by both suites
+    client = SecurityMCPClient(max_concurrency=MAX_CONCURRENCY)
+    print("🔌 Connecting to MCP server...")
+    try:
+        await client.connect()
+    except Exception as e:
+        print(f"❌ Connection failed: {e}")
+        print("\n💥 Basic tests failed. Please check your setup.")
+        return 1
+    print("✅ Connected successfully\n")
+    
+    # The suites share no state beyond the session, so run them concurrently;
+    # each returns its report lines, printed afterwards in order
+    try:
+        # Discovery calls are independent: run them together so the suites
+        # start with the tool and prompt catalogs already cached on the client
+        # return_exceptions lets every call settle before the finally disconnects
+        discovered = await asyncio.gather(
+            load_samples(client),
+            client.list_tools(),
+            client.load_prompts(),
+            return_exceptions=True,
+        )
+        errors = [result for result in discovered if isinstance(result, Exception)]
+        if errors:
+            for error in errors:
+                print(f"❌ Test failed: {error}")
+                logger.error("discovery failed", exc_info=error)
+            print("\n💥 Basic tests failed. Please check your setup.")
             return 1
+        files_result = discovered[0]
+        (basic_test_passed, basic_lines), (workflow_test_passed, workflow_lines) = await asyncio.gather(
+            test_mcp_server(client, files_result),
+            test_workflow(client, files_result),
+        )
+    finally:
+        await client.disconnect()
+        print("🔌 Disconnected from server")
+    # Both suites' reports go out in one write
+    print("\n".join(basic_lines + workflow_lines))
+    
+    if basic_test_passed and workflow_test_passed:
+        print("\n🎊 All tests passed! MCP server is working correctly.")
+        return 0
+    elif basic_test_passed:
+        print("\n⚠️ Basic tests passed but workflow test failed.")
+        return 1
+    elif workflow_test_passed:
+        print("\n⚠️ Workflow test passed but basic tests failed.")
+        return 1
     else:
         print("\n💥 Basic tests failed. Please check your setup.")
         return 1
 
 if __name__ == "__main__":
-    exit_code = asyncio.run(main())
+    exit_code = run_with_uvloop(main())
     sys.exit(exit_code)
 